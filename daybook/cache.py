@@ -0,0 +1,341 @@
+"""
+Two-level cache backend and stampede-safe recomputation.
+
+TieredCache keeps a small per-process LRU (L1) in front of a shared cache
+(L2, Redis in production). Hot keys are then served without a network
+round trip, and every worker still sees the same data within L1_TIMEOUT
+seconds. get_or_compute() wraps expensive aggregates so that an expiring
+key is recomputed by one worker instead of all of them at once.
+"""
+import logging
+import math
+import pickle
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.functional import cached_property
+
+from .instrumentation import record_cache
+
+
+logger = logging.getLogger("daybook")
+
+# Weight of the probabilistic early expiration; > 1 recomputes earlier
+XFETCH_BETA = 1.0
+# Seconds a cold-miss recomputation lock is held at most
+RECOMPUTE_LOCK_TIMEOUT = 10
+# Seconds between polls while another worker recomputes a cold key
+RECOMPUTE_POLL_INTERVAL = 0.05
+
+_bypass_l1 = ContextVar("bypass_l1", default=False)
+
+# L1 stores and their locks, shared by every TieredCache instance with the
+# same (LOCATION, L2) in this process. Django creates one backend instance
+# per thread and async context, so an L1 kept on the instance would be
+# per-thread, and a write would only evict the writing thread's copy.
+_l1_stores = {}
+_l1_locks = {}
+
+
+@contextmanager
+def bypass_l1():
+    """
+    Makes TieredCache reads inside the block skip the L1 and go to the L2
+    (refreshing the L1 on the way). For output that outlives the request,
+    such as a cached page, which must not be built from a stale L1 copy.
+    """
+    token = _bypass_l1.set(True)
+    try:
+        yield
+    finally:
+        _bypass_l1.reset(token)
+
+
+class TieredCache(BaseCache):
+    """
+    In-process LRU (L1) in front of another configured cache alias (L2).
+
+    LOCATION (optional) names the L1, like LocMemCache's; backends with
+    the same LOCATION and L2 share one L1 per process.
+
+    OPTIONS:
+        L2 (str): alias of the shared cache in settings.CACHES.
+        L1_MAX_ENTRIES (int): LRU capacity per process.
+        L1_TIMEOUT (int): upper bound, in seconds, on how long a value is
+            served from L1. Writes and deletes reach L1 on the local
+            process only, so this is the staleness other processes may see.
+
+    get() and get_many() report hits and misses (from either level) to
+    the request metrics (see daybook.instrumentation).
+
+    An unreachable L2 is logged and degrades instead of failing the
+    request: reads are L1 hits or misses, writes only reach the L1, add()
+    falls back to the L1 (a per-process lock for get_or_compute) and
+    incr() reports the key as missing.
+
+    Values are pickled in L1 just like LocMemCache does, so callers that
+    mutate what they get never affect other threads.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._l2_alias = options.get("L2", "shared")
+        self._l1_max_entries = options.get("L1_MAX_ENTRIES", 1000)
+        self._l1_timeout = options.get("L1_TIMEOUT", 5)
+        name = (location, self._l2_alias)
+        self._l1 = _l1_stores.setdefault(name, OrderedDict())
+        self._lock = _l1_locks.setdefault(name, threading.Lock())
+
+    @cached_property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def _l1_get(self, key, version):
+        if _bypass_l1.get():
+            return False, None
+        l1_key = self.make_key(key, version)
+        with self._lock:
+            item = self._l1.get(l1_key)
+            if item is None:
+                return False, None
+            pickled, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._l1[l1_key]
+                return False, None
+            self._l1.move_to_end(l1_key)
+        return True, pickle.loads(pickled)
+
+    def _l1_set(self, key, value, timeout, version):
+        timeout = self.get_backend_timeout(timeout)
+        ttl = self._l1_timeout if timeout is None else min(timeout, self._l1_timeout)
+        if ttl <= 0:
+            self._l1_delete(key, version)
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        l1_key = self.make_key(key, version)
+        with self._lock:
+            self._l1[l1_key] = (pickled, time.monotonic() + ttl)
+            self._l1.move_to_end(l1_key)
+            while len(self._l1) > self._l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_delete(self, key, version):
+        with self._lock:
+            self._l1.pop(self.make_key(key, version), None)
+
+    def _l2_failed(self, operation, error):
+        logger.warning(f"Shared cache {self._l2_alias!r} unavailable for {operation}: {error}")
+
+    def get(self, key, default=None, version=None):
+        found, value = self._l1_get(key, version)
+        if found:
+            record_cache(1, 0)
+            return value
+        sentinel = object()
+        try:
+            value = self.l2.get(key, sentinel, version=version)
+        except Exception as error:
+            self._l2_failed("get", error)
+            value = sentinel
+        if value is sentinel:
+            record_cache(0, 1)
+            return default
+        record_cache(1, 0)
+        self._l1_set(key, value, DEFAULT_TIMEOUT, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            hit, value = self._l1_get(key, version)
+            if hit:
+                found[key] = value
+            else:
+                missing.append(key)
+        misses = 0
+        if missing:
+            try:
+                fetched = self.l2.get_many(missing, version=version)
+            except Exception as error:
+                self._l2_failed("get_many", error)
+                fetched = {}
+            for key, value in fetched.items():
+                self._l1_set(key, value, DEFAULT_TIMEOUT, version)
+            found.update(fetched)
+            misses = len(missing) - len(fetched)
+        record_cache(len(found), misses)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        try:
+            self.l2.set(key, value, timeout, version=version)
+        except Exception as error:
+            self._l2_failed("set", error)
+        self._l1_set(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        try:
+            failed = self.l2.set_many(data, timeout, version=version)
+        except Exception as error:
+            self._l2_failed("set_many", error)
+            failed = []
+        for key, value in data.items():
+            if key not in failed:
+                self._l1_set(key, value, timeout, version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        try:
+            added = self.l2.add(key, value, timeout, version=version)
+        except Exception as error:
+            self._l2_failed("add", error)
+            found, _ = self._l1_get(key, version)
+            added = not found
+        if added:
+            self._l1_set(key, value, timeout, version)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l1_delete(key, version)
+        try:
+            return self.l2.touch(key, timeout, version=version)
+        except Exception as error:
+            self._l2_failed("touch", error)
+            return False
+
+    def incr(self, key, delta=1, version=None):
+        self._l1_delete(key, version)
+        try:
+            return self.l2.incr(key, delta, version=version)
+        except ValueError:
+            raise
+        except Exception as error:
+            self._l2_failed("incr", error)
+            raise ValueError(f"Key '{key}' not found") from error
+
+    def delete(self, key, version=None):
+        self._l1_delete(key, version)
+        try:
+            return self.l2.delete(key, version=version)
+        except Exception as error:
+            self._l2_failed("delete", error)
+            return False
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._l1_delete(key, version)
+        try:
+            self.l2.delete_many(keys, version=version)
+        except Exception as error:
+            self._l2_failed("delete_many", error)
+
+    def has_key(self, key, version=None):
+        found, _ = self._l1_get(key, version)
+        if found:
+            return True
+        try:
+            return self.l2.has_key(key, version=version)
+        except Exception as error:
+            self._l2_failed("has_key", error)
+            return False
+
+    def clear(self):
+        with self._lock:
+            self._l1.clear()
+        self.l2.clear()
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
+
+
+class CountingCache:
+    """
+    Passes everything through to `backend`, reporting the hits and misses
+    of get() and get_many() to the request metrics as TieredCache does.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def get(self, key, default=None, version=None):
+        sentinel = object()
+        value = self.backend.get(key, sentinel, version=version)
+        if value is sentinel:
+            record_cache(0, 1)
+            return default
+        record_cache(1, 0)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = self.backend.get_many(keys, version=version)
+        record_cache(len(found), len(keys) - len(found))
+        return found
+
+
+def shared_cache():
+    """
+    The cache every process sees immediately: the L2 behind TieredCache
+    (or the default cache itself for any other backend), with its reads
+    counted in the request metrics. For counters and versions that must
+    not be served stale from a per-process L1.
+    """
+    return CountingCache(getattr(cache, "l2", cache))
+
+
+def get_or_compute(key, compute, timeout, beta=XFETCH_BETA):
+    """
+    Returns the cached value for `key`, computing it with `compute()` when
+    needed, without letting an expiry stampede the database.
+
+    Two protections:
+      - Probabilistic early expiration ("XFetch"): the value is stored with
+        how long it took to compute, and each reader recomputes early with
+        a probability that rises as the expiry approaches and with the cost
+        of the computation. One worker usually refreshes a hot key shortly
+        before it expires while the others keep serving the cached copy.
+      - Single flight on a cold miss: only the worker that wins a short
+        cache.add() lock recomputes; the others poll for its result and
+        only compute themselves if the lock holder takes too long.
+    """
+    envelope = cache.get(key)
+    if envelope is not None:
+        value, delta, expires_at = envelope
+        # 1 - random() lies in (0, 1], so the log is always defined
+        if time.time() - delta * beta * math.log(1.0 - random.random()) < expires_at:
+            return value
+        return _recompute(key, compute, timeout)
+
+    lock_key = f"{key}:recompute-lock"
+    if cache.add(lock_key, 1, RECOMPUTE_LOCK_TIMEOUT):
+        try:
+            return _recompute(key, compute, timeout)
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + RECOMPUTE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(RECOMPUTE_POLL_INTERVAL)
+        envelope = cache.get(key)
+        if envelope is not None:
+            return envelope[0]
+    return _recompute(key, compute, timeout)
+
+
+def _recompute(key, compute, timeout):
+    started = time.monotonic()
+    value = compute()
+    delta = time.monotonic() - started
+    cache.set(key, (value, delta, time.time() + timeout), timeout)
+    return value
@@ -0,0 +1,143 @@
+"""
+Per-request query, cache and latency accounting.
+
+RequestMetricsMiddleware opens a RequestMetrics for each request in a
+context variable. Every database connection carries record_query() as an
+execute wrapper (installed when the connection is created), and
+TieredCache and shared_cache() report their lookups through
+record_cache(); both are no-ops outside a request. Context variables follow the request into
+sync_to_async() threads, so async views are counted as well.
+
+When the response is ready the middleware adds a Server-Timing header,
+logs one key=value line per request to the "daybook" logger and warns
+when the view ran more queries than its budget in
+settings.VIEW_QUERY_BUDGETS (keyed by view class or function name).
+"""
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger("daybook")
+
+_current = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    __slots__ = ("started", "queries", "db_time", "cache_hits", "cache_misses")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper counting statements and their time for the current request."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+def record_cache(hits, misses):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_recorder)
+
+
+def view_label(request):
+    """The resolved view's class or function name, or '-' if none matched."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "-"
+    view = getattr(match.func, "view_class", match.func)
+    return getattr(view, "__name__", match.view_name)
+
+
+class RequestMetricsMiddleware:
+    """
+    Measures each request (see the module docstring). Place it first in
+    MIDDLEWARE so the session and auth queries are counted too. Works
+    under WSGI and ASGI without forcing async views onto a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.budgets = getattr(settings, "VIEW_QUERY_BUDGETS", {})
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Connections opened before this module was imported
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        """
+        Adds Server-Timing, logs the request and checks the query budget.
+        Streaming responses are measured up to their first byte.
+        """
+        total_ms = (time.perf_counter() - metrics.started) * 1000
+        db_ms = metrics.db_time * 1000
+        label = view_label(request)
+
+        response["Server-Timing"] = (
+            f'db;dur={db_ms:.1f};desc="{metrics.queries} queries", '
+            f'cache;desc="{metrics.cache_hits} hits, {metrics.cache_misses} misses", '
+            f"total;dur={total_ms:.1f}"
+        )
+        logger.info(
+            f"request view={label} method={request.method} status={response.status_code} "
+            f"queries={metrics.queries} db_ms={db_ms:.1f} cache_hits={metrics.cache_hits} "
+            f"cache_misses={metrics.cache_misses} total_ms={total_ms:.1f}"
+        )
+
+        budget = self.budgets.get(label)
+        if budget is not None and metrics.queries > budget:
+            logger.warning(
+                f"Query budget exceeded: view={label} queries={metrics.queries} "
+                f"budget={budget} path={request.path}"
+            )
+        return response
@@ -48,11 +48,12 @@ INSTALLED_APPS = [
     'myapp',
     'users',
 
-    "debug_toolbar",
     "mptt",
 ]
 
 MIDDLEWARE = [
+    # First, so the session and auth queries are counted too
+    'daybook.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,10 +61,29 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
 ]
 
+# The toolbar records every query with its stack trace, far too slow to run
+# under load; the request metrics middleware covers non-DEBUG deployments
+if DEBUG:
+    INSTALLED_APPS += ["debug_toolbar"]
+    MIDDLEWARE += ["debug_toolbar.middleware.DebugToolbarMiddleware"]
+
+# Queries a view may run per request before daybook.instrumentation logs a
+# warning, keyed by view class (or function) name. Unlisted views are not
+# checked.
+VIEW_QUERY_BUDGETS = {
+    "EntryListView": 10,
+    "EntryDetailView": 10,
+    "FavouriteListView": 8,
+    "CommentAjaxView": 12,
+    "CommentAjaxAsyncView": 12,
+    "LikeToggleView": 5,
+    "LikeToggleAsyncView": 5,
+    "EntrySearchView": 4,
+    "LiveSearchAsyncView": 4,
+}
+
 ROOT_URLCONF = 'daybook.urls'
 
 TEMPLATES = [
@@ -98,13 +118,46 @@ DATABASES = {
     }
 }
 
+# "default" is a per-process LRU in front of the "shared" cache (see
+# daybook/cache.py). Set REDIS_URL to share it between hosts; without it a
+# file-based cache stands in so local development needs no extra services.
+REDIS_URL = os.getenv("REDIS_URL")
+
 CACHES = {
     "default": {
+        "BACKEND": "daybook.cache.TieredCache",
+        "OPTIONS": {
+            "L2": "shared",
+            "L1_MAX_ENTRIES": 1000,
+            "L1_TIMEOUT": 5,
+        },
+    },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+    } if REDIS_URL else {
         "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
         "LOCATION": BASE_DIR / "cache",
-    }
+    },
+}
+
+# Write-behind buffering of like/favourite toggles (see myapp/writebehind.py).
+# Off by default; enable it when a few hot entries make the per-click
+# statement contend on the entry row.
+MEMBERSHIP_WRITE_BEHIND = {
+    "ENABLED": os.getenv("MEMBERSHIP_WRITE_BEHIND") == "1",
+    "FLUSH_INTERVAL": 1.0,
+    "MAX_PENDING": 10000,
+    "JOURNAL_DIR": BASE_DIR / "journal",
+    "JOURNAL_FSYNC": False,
 }
 
+# Serve the comment, like and live-search AJAX endpoints with their
+# async-native views. Only worth it under ASGI (daybook.asgi, e.g.
+# `uvicorn daybook.asgi:application`); under WSGI each async view runs in
+# its own event loop. Compare with the loadtest_ajax command.
+ASYNC_AJAX_VIEWS = os.getenv("ASYNC_AJAX_VIEWS") == "1"
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -153,12 +206,25 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_REDIRECT_URL = "/"
 
+# EmailOrUsernameModelBackend handles every login (and ends the chain on a
+# wrong password, so it is still one query and one hash). ModelBackend stays
+# listed so sessions created before it was added keep resolving their user.
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
     'users.authentication.EmailOrUsernameModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
 ]
 
+# Reverse proxies in front of the app that append the client address to
+# X-Forwarded-For; the login rate limit keys on the address the outermost
+# one saw. 0 (the default) trusts no header and uses REMOTE_ADDR.
+RATELIMIT_TRUSTED_PROXY_COUNT = int(os.getenv("RATELIMIT_TRUSTED_PROXY_COUNT", "0"))
+
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
+DEFAULT_FROM_EMAIL = "noreply@yoursite.com"
+# Views queue mail in users.OutboundEmail; run `manage.py send_queued_mail
+# --loop` to deliver it. For local SMTP testing point EMAIL_BACKEND at
+# django.core.mail.backends.smtp.EmailBackend with EMAIL_HOST=localhost,
+# EMAIL_PORT=1025 and run `python -m aiosmtpd -n -l localhost:1025`.
 
 
 CSRF_COOKIE_HTTPONLY = False
@@ -0,0 +1,163 @@
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import BaseCache
+from django.test import SimpleTestCase, override_settings
+
+from .cache import get_or_compute, shared_cache
+from .instrumentation import RequestMetrics, _current
+
+
+class UnavailableCache(BaseCache):
+    """Stands in for a Redis server that refuses every connection."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+
+    def _fail(self, *args, **kwargs):
+        raise ConnectionError("Connection refused")
+
+    get = set = add = touch = delete = get_many = set_many = delete_many = _fail
+    incr = has_key = clear = _fail
+
+
+def tiered_caches(l2_backend="django.core.cache.backends.locmem.LocMemCache"):
+    # LocMemCache is the local stand-in for Redis: one store per process,
+    # shared by every thread, like a server all workers talk to
+    return {
+        "default": {
+            "BACKEND": "daybook.cache.TieredCache",
+            "LOCATION": "tests",
+            "OPTIONS": {"L2": "shared", "L1_MAX_ENTRIES": 100, "L1_TIMEOUT": 60},
+        },
+        "shared": {"BACKEND": l2_backend, "LOCATION": "tests-shared"},
+    }
+
+
+def in_thread(function):
+    """Runs `function` in a new thread (with its own cache instances); returns its result."""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+@override_settings(CACHES=tiered_caches())
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_l1_serves_until_l2_changes_behind_it(self):
+        cache.set("key", "old")
+        shared_cache().set("key", "new")
+        self.assertEqual(cache.get("key"), "old")
+
+    def test_set_in_another_thread_reaches_this_threads_l1(self):
+        cache.set("key", "old")
+        self.assertEqual(cache.get("key"), "old")
+        in_thread(lambda: caches["default"].set("key", "new"))
+        self.assertEqual(cache.get("key"), "new")
+
+    def test_delete_in_another_thread_reaches_this_threads_l1(self):
+        cache.set("key", "old")
+        in_thread(lambda: caches["default"].delete("key"))
+        self.assertIsNone(cache.get("key"))
+        self.assertIsNone(shared_cache().get("key"))
+
+    def test_incr_in_another_thread_reaches_this_threads_l1(self):
+        cache.set("counter", 1)
+        self.assertEqual(cache.get("counter"), 1)
+        self.assertEqual(in_thread(lambda: caches["default"].incr("counter", 2)), 3)
+        self.assertEqual(cache.get("counter"), 3)
+
+    def test_instances_share_one_l1(self):
+        self.assertIsNot(in_thread(lambda: caches["default"]), caches["default"])
+        self.assertIs(in_thread(lambda: caches["default"]._l1), caches["default"]._l1)
+
+
+@override_settings(CACHES=tiered_caches())
+class CacheMetricsTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.metrics = RequestMetrics()
+        self.token = _current.set(self.metrics)
+        self.addCleanup(_current.reset, self.token)
+
+    def test_tiered_and_shared_reads_are_counted(self):
+        cache.set("tiered", 1)
+        shared_cache().set("shared", 1)
+
+        cache.get("tiered")
+        shared_cache().get("shared")
+        shared_cache().get("absent")
+        shared_cache().get_many(["shared", "absent"])
+
+        self.assertEqual((self.metrics.cache_hits, self.metrics.cache_misses), (3, 2))
+
+
+@override_settings(CACHES=tiered_caches())
+class GetOrComputeTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_cold_miss_is_computed_once(self):
+        calls = []
+        barrier = threading.Barrier(8)
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 42
+
+        def worker():
+            barrier.wait()
+            return get_or_compute("aggregate", compute, 60)
+
+        threads = [threading.Thread(target=lambda: results.append(worker())) for _ in range(8)]
+        results = []
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [42] * 8)
+
+    def test_value_is_recomputed_early_as_expiry_nears(self):
+        # A 10 s computation expiring in 1 s; with random() = 0.5 the early
+        # expiration reaches 10 * ln 2 ≈ 7 s ahead
+        cache.set("aggregate", ("cached", 10.0, time.time() + 1), 60)
+        with mock.patch("daybook.cache.random.random", return_value=0.5):
+            self.assertEqual(get_or_compute("aggregate", lambda: "computed", 60), "computed")
+        self.assertEqual(cache.get("aggregate")[0], "computed")
+
+    def test_value_far_from_expiry_is_not_recomputed_early(self):
+        cache.set("aggregate", ("cached", 10.0, time.time() + 30), 60)
+        with mock.patch("daybook.cache.random.random", return_value=0.5):
+            self.assertEqual(get_or_compute("aggregate", lambda: "computed", 60), "cached")
+
+
+@override_settings(CACHES=tiered_caches("daybook.tests.UnavailableCache"))
+class L2UnavailableTests(SimpleTestCase):
+    def setUp(self):
+        with self.assertLogs("daybook", "WARNING"):
+            cache.delete_many(["key", "counter", "aggregate"])
+
+    def test_reads_miss_and_writes_reach_the_l1(self):
+        with self.assertLogs("daybook", "WARNING"):
+            self.assertIsNone(cache.get("key"))
+            cache.set("key", "value")
+        self.assertEqual(cache.get("key"), "value")
+        self.assertEqual(cache.get_many(["key"]), {"key": "value"})
+
+    def test_incr_reports_a_missing_key(self):
+        with self.assertLogs("daybook", "WARNING"), self.assertRaises(ValueError):
+            cache.incr("counter")
+
+    def test_get_or_compute_still_computes(self):
+        with self.assertLogs("daybook", "WARNING"):
+            self.assertEqual(get_or_compute("aggregate", lambda: "computed", 60), "computed")
+        self.assertEqual(get_or_compute("aggregate", lambda: "again", 60), "computed")
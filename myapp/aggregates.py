@@ -0,0 +1,113 @@
+"""
+Incrementally maintained sidebar aggregates for EntryListView.
+
+Every number lives in its own cache key. Signals in myapp.signals adjust the
+keys with cache.incr() as entries and comments change, so the list page
+reads them with one get_many() instead of running GROUP BY / COUNT queries.
+The full aggregates only run to reconcile: once per
+AGGREGATE_RECONCILE_INTERVAL, when a key has been evicted, and from the
+reconcile_entry_counters command.
+"""
+from django.core.cache import cache
+from django.db.models import Count, Sum
+
+from daybook.cache import get_or_compute
+
+from .models import Entry
+
+
+# Seconds between full recounts that correct any drift in the counters
+AGGREGATE_RECONCILE_INTERVAL = 60 * 60
+# Counter keys outlive the reconcile interval so they never expire first
+AGGREGATE_TIMEOUT = AGGREGATE_RECONCILE_INTERVAL * 2
+
+# Entry count per category, over all entries (published or not)
+CATEGORY_KEYS = {
+    value: f"categories_list:{value}" for value in Entry.Category.values
+}
+
+# Totals over published entries
+TOTALS_KEYS = {
+    "total_users": "entry_totals:users",
+    "total_comments": "entry_totals:comments",
+    "total_entries": "entry_totals:entries",
+}
+
+
+def reconcile_categories():
+    """Recounts entries per category and overwrites the cached counters."""
+    counts = dict(
+        Entry.objects.order_by().values_list("category").annotate(count=Count("id"))
+    )
+    values = {key: counts.get(value, 0) for value, key in CATEGORY_KEYS.items()}
+    cache.set_many(values, AGGREGATE_TIMEOUT)
+    return values
+
+
+def reconcile_totals():
+    """Recomputes the published-entry totals and overwrites the cached counters."""
+    totals = Entry.objects.filter(is_published=True).aggregate(
+        total_users=Count("author", distinct=True),
+        total_comments=Sum("total_comments", default=0),
+        total_entries=Count("id"),
+    )
+    values = {TOTALS_KEYS[name]: totals[name] for name in TOTALS_KEYS}
+    cache.set_many(values, AGGREGATE_TIMEOUT)
+    return values
+
+
+def _read(keys, reconcile, marker):
+    # The marker expires every reconcile interval; get_or_compute() makes
+    # sure only one worker (usually slightly early) runs the recount.
+    get_or_compute(marker, lambda: bool(reconcile()), AGGREGATE_RECONCILE_INTERVAL)
+    values = cache.get_many(keys)
+    if len(values) < len(keys):
+        values = reconcile()
+    return values
+
+
+def get_categories():
+    """
+    Returns [{'label', 'count', 'name'}, ...] for every category that has
+    entries, in Entry.Category order.
+    """
+    values = _read(list(CATEGORY_KEYS.values()), reconcile_categories, "categories_list")
+    categories = []
+    for value, key in CATEGORY_KEYS.items():
+        count = values.get(key, 0)
+        if count > 0:
+            category = Entry.Category(value)
+            categories.append({"label": category.label, "count": count, "name": category.value})
+    return categories
+
+
+def get_totals():
+    """Returns {'total_users', 'total_comments', 'total_entries'}."""
+    values = _read(list(TOTALS_KEYS.values()), reconcile_totals, "entry_totals")
+    return {name: values.get(key, 0) for name, key in TOTALS_KEYS.items()}
+
+
+def _incr(key, delta):
+    if not delta:
+        return
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Key not cached (evicted or never read): the next read reconciles
+        pass
+
+
+def bump_category(category, delta):
+    if category in CATEGORY_KEYS:
+        _incr(CATEGORY_KEYS[category], delta)
+
+
+def bump_totals(users=0, comments=0, entries=0):
+    _incr(TOTALS_KEYS["total_users"], users)
+    _incr(TOTALS_KEYS["total_comments"], comments)
+    _incr(TOTALS_KEYS["total_entries"], entries)
+
+
+def invalidate_aggregates():
+    """Drops every counter so the next read recounts from the database."""
+    cache.delete_many(list(CATEGORY_KEYS.values()) + list(TOTALS_KEYS.values()))
@@ -0,0 +1,86 @@
+"""
+Shared pieces of the benchmark harness (seed_benchmark, run_benchmarks).
+
+seed_benchmark fills the database with users whose names start with
+BENCH_USER_PREFIX, so the benchmarks can find (and --flush can remove) the
+fixture without touching real data. Popularity follows a Zipf law: a few
+authors write most entries and a few entries collect most comments and
+likes, which is what makes the hot paths hot in production.
+
+Results are JSON documents of the form
+
+    {"meta": {...}, "results": {scenario: {"p50_ms", "p95_ms", "mean_ms",
+                                           "queries", "requests", "errors"}}}
+
+and compare() checks one against a saved baseline.
+"""
+import bisect
+import itertools
+import random
+import statistics
+
+
+BENCH_USER_PREFIX = "bench_"
+# Text of the comments run_benchmarks posts, removed again after the run
+BENCH_COMMENT_TEXT = "Benchmark comment"
+
+# Words titles and texts are drawn from (Zipf-weighted, so early words are
+# common); SEARCH_TERM is frequent enough to match many entries
+VOCABULARY = (
+    "morning run study notes coffee sleep focus habit walk reading journal "
+    "exam project weekend recipe garden music friends family travel rain "
+    "meditation workout lecture library deadline budget cooking yoga stretch "
+    "breakfast evening reflection gratitude goals progress review plan "
+    "practice language chapter essay thesis lab bike swim hike mountain lake "
+    "city train market bakery tea sunrise sunset winter spring summer autumn"
+).split()
+SEARCH_TERM = "study"
+
+
+class Zipf:
+    """Draws indexes 0..n-1 with probability proportional to 1 / (rank ** s)."""
+
+    def __init__(self, n, s=1.1, rng=random):
+        self.rng = rng
+        self.cum_weights = list(itertools.accumulate(1 / (rank ** s) for rank in range(1, n + 1)))
+
+    def __call__(self):
+        return bisect.bisect(self.cum_weights, self.rng.random() * self.cum_weights[-1])
+
+
+def words(zipf, count):
+    """`count` vocabulary words drawn from `zipf` (a Zipf over VOCABULARY)."""
+    return " ".join(VOCABULARY[zipf()] for _ in range(count))
+
+
+def summarize(latencies, queries, errors):
+    """Scenario result from per-request latencies (seconds) and query counts."""
+    if len(latencies) >= 2:
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+        p50, p95 = cuts[49], cuts[94]
+    else:
+        p50 = p95 = latencies[0] if latencies else 0.0
+    return {
+        "p50_ms": round(p50 * 1000, 2),
+        "p95_ms": round(p95 * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "queries": round(statistics.fmean(queries), 2) if queries else 0.0,
+        "requests": len(latencies),
+        "errors": errors,
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Yields (scenario, metric, baseline value, current value, regressed)
+    for every scenario present in both. Latency regresses when it grows by
+    more than `threshold` (a fraction); queries per request regress on any
+    increase, since they do not depend on the machine.
+    """
+    for name, current in results["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            yield name, metric, before[metric], current[metric], current[metric] > before[metric] * (1 + threshold)
+        yield name, "queries", before["queries"], current["queries"], current["queries"] > before["queries"]
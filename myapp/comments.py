@@ -0,0 +1,170 @@
+from django.db.models import Q
+
+from daybook.cache import shared_cache
+
+from .models import Comment
+from .pagination import CursorPaginator
+
+
+# Seconds a built comment tree stays cached; signals evict it on change.
+# Kept in the shared cache only: a per-process L1 copy could outlive the
+# eviction and be served under the entry's new ETag (see myapp.versions)
+COMMENT_TREE_TIMEOUT = 60 * 60
+# Top-level threads per page (also the number rendered on the detail page)
+COMMENT_THREADS_PAGE_SIZE = 10
+# Direct replies returned per "load more replies" request
+COMMENT_REPLIES_PAGE_SIZE = 10
+# Threads with more descendants than this are not inlined; the client
+# pages through them with the replies endpoint instead
+COMMENT_INLINE_DESCENDANTS = 50
+
+
+def comment_tree_key(entry_id):
+    return f"comment_tree:{entry_id}"
+
+
+def descendant_count(node):
+    """Number of replies below `node`, read from its MPTT bounds (no query)."""
+    return (node.rght - node.lft - 1) // 2
+
+
+def published_comments(entry_id):
+    return (
+        Comment.objects.filter(
+            entry_id=entry_id,
+            is_published=True,
+            level__lte=Comment.MAX_DEPTH,
+        )
+        .select_related("author")
+    )
+
+
+def build_comment_tree(nodes, attach_to=()):
+    """
+    Links comments into nested form in a single pass.
+
+    `nodes` must be in MPTT (tree_id, lft) order, i.e. every parent comes
+    before its descendants, so each node's parent is already known when it
+    is reached. Children are stored in `_cached_children`, the attribute
+    django-mptt's get_children() and recursetree read, so walking the tree
+    afterwards never queries. `attach_to` holds already-loaded parents
+    that `nodes` may hang from. Nodes whose parent was filtered out
+    (unpublished or beyond Comment.MAX_DEPTH) are dropped together with
+    their replies.
+
+    Returns (roots, nodes_kept) — the top-level comments and the flat list
+    of every kept comment in display order.
+    """
+    roots = []
+    kept = []
+    by_id = {parent.pk: parent for parent in attach_to}
+
+    for node in nodes:
+        node._cached_children = []
+        if node.parent_id is None:
+            roots.append(node)
+        else:
+            parent = by_id.get(node.parent_id)
+            if parent is None:
+                continue
+            parent._cached_children.append(node)
+        by_id[node.pk] = node
+        kept.append(node)
+
+    return roots, kept
+
+
+def load_subtrees(entry_id, heads):
+    """
+    Attaches the replies of each comment in `heads` using one query.
+
+    Each subtree is selected by its MPTT range (same tree_id, lft/rght
+    strictly inside the head's bounds). Heads with more than
+    COMMENT_INLINE_DESCENDANTS replies are left empty and flagged with
+    `replies_deferred` so the client can page through them instead.
+    """
+    ranges = Q()
+    for head in heads:
+        head._cached_children = []
+        head.replies_deferred = descendant_count(head) > COMMENT_INLINE_DESCENDANTS
+        if 0 < descendant_count(head) and not head.replies_deferred:
+            ranges |= Q(tree_id=head.tree_id, lft__gt=head.lft, rght__lt=head.rght)
+
+    if not ranges:
+        return []
+
+    descendants = published_comments(entry_id).filter(ranges).order_by("tree_id", "lft")
+    return build_comment_tree(descendants, attach_to=heads)[1]
+
+
+def thread_page(entry_id, cursor=None):
+    """
+    Returns a CursorPage of top-level comments with their replies loaded.
+
+    Threads are ordered oldest first and paged by keyset on
+    (created_at, id), so deep pages cost the same as the first one.
+    """
+    roots = published_comments(entry_id).filter(parent__isnull=True).order_by("created_at")
+    page = CursorPaginator(roots, COMMENT_THREADS_PAGE_SIZE).page(cursor)
+    load_subtrees(entry_id, page.object_list)
+    return page
+
+
+def reply_page(entry_id, node, cursor=None):
+    """
+    Returns a CursorPage of `node`'s direct replies with their replies
+    loaded. Siblings are stored in insertion order, so they are paged by
+    their lft value.
+    """
+    children = published_comments(entry_id).filter(parent_id=node.pk).order_by("lft")
+    page = CursorPaginator(children, COMMENT_REPLIES_PAGE_SIZE).page(cursor)
+    load_subtrees(entry_id, page.object_list)
+    return page
+
+
+def serialize_comment(node):
+    """Nested JSON-ready dict for a comment and its loaded replies."""
+    return {
+        "id": node.pk,
+        "parent": node.parent_id,
+        "author": node.author.username,
+        "text": node.text,
+        "created_at": node.created_at,
+        "level": node.level,
+        "reply_count": descendant_count(node),
+        "replies_deferred": getattr(node, "replies_deferred", False),
+        "replies": [serialize_comment(child) for child in node._cached_children],
+    }
+
+
+def get_comment_tree(entry):
+    """
+    Returns (roots, nodes, next_cursor) for the first page of an entry's
+    published comment threads.
+
+    `nodes` is the flat (tree_id, lft)-ordered list of every loaded comment
+    and `next_cursor` continues at the next thread via the JSON endpoint
+    (None when every thread fits on the page). Cached per entry until a
+    comment on that entry is saved or deleted.
+    """
+    key = comment_tree_key(entry.pk)
+    tree = shared_cache().get(key)
+    if tree is None:
+        page = thread_page(entry.pk)
+        nodes = []
+        for root in page.object_list:
+            nodes.append(root)
+            nodes.extend(_walk(root))
+        tree = (page.object_list, nodes, page.next_cursor)
+        shared_cache().set(key, tree, COMMENT_TREE_TIMEOUT)
+    return tree
+
+
+def _walk(node):
+    for child in node._cached_children:
+        yield child
+        yield from _walk(child)
+
+
+def invalidate_comment_tree(entry_id):
+    shared_cache().delete(comment_tree_key(entry_id))
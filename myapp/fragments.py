@@ -0,0 +1,99 @@
+"""
+Rendered-HTML cache for the parts of the entry pages shared by every user.
+
+An entry card (list pages) and an entry body (detail page) only depend on
+the entry and its author, so their HTML is cached under a key built from
+the entry's public_id, updated_at and counters and the author's username
+and avatar. Any edit moves updated_at, any like, favourite or comment
+moves a counter and a profile change moves the author part, so a changed
+entry simply misses; EntryUpdateView and EntryDeleteView also delete the
+old keys so stale fragments do not wait for the timeout. Per-user state
+(liked, favourited) is never part of a fragment; the page templates
+render it around the cached HTML on every request.
+
+The fragments are lazy: nothing is read from the cache or rendered until
+a page template outputs {{ entry.card_html }} or {{ entry_body }}, so a
+template that does not use them costs nothing.
+"""
+import functools
+import hashlib
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.functional import lazy
+from django.utils.safestring import SafeString, mark_safe
+
+
+# Seconds a rendered fragment stays cached; the key changes on any edit
+FRAGMENT_TIMEOUT = 24 * 60 * 60
+# Bump when the fragment templates change, to orphan the old HTML
+FRAGMENT_VERSION = 1
+
+CARD_TEMPLATE = "myapp/includes/entry_card.html"
+BODY_TEMPLATE = "myapp/includes/entry_body.html"
+
+
+def _author_part(author):
+    """Digest of the author details the fragments show."""
+    profile = getattr(author, "profile", None)
+    avatar = profile.avatar_url() if profile is not None else ""
+    return hashlib.md5(f"{author.username}:{avatar}".encode()).hexdigest()[:12]
+
+
+def fragment_key(kind, entry):
+    counters = f"{entry.total_likes}.{entry.total_favorites}.{entry.total_comments}"
+    return (
+        f"fragment:{kind}:v{FRAGMENT_VERSION}:{entry.public_id}:"
+        f"{int(entry.updated_at.timestamp() * 1e6)}:{counters}:{_author_part(entry.author)}"
+    )
+
+
+def _lazy_html(load):
+    """Safe HTML from `load()`, called once, the first time it is output."""
+    return lazy(functools.cache(load), SafeString)()
+
+
+def _load_cards(entries):
+    """Card HTML for `entries`, in order: one get_many, at most one set_many."""
+    keys = [fragment_key("card", entry) for entry in entries]
+    cached = cache.get_many(keys)
+
+    rendered = {}
+    for key, entry in zip(keys, entries):
+        if key not in cached:
+            rendered[key] = render_to_string(CARD_TEMPLATE, {"entry": entry})
+    if rendered:
+        cache.set_many(rendered, FRAGMENT_TIMEOUT)
+    return [mark_safe(cached[key] if key in cached else rendered[key]) for key in keys]
+
+
+def render_cards(entries):
+    """
+    Sets a lazy `card_html` on each entry. The first card a template
+    outputs loads the whole page's cards at once, rendering only those
+    missing from the cache.
+    """
+    entries = list(entries)
+    cards = functools.cache(lambda: _load_cards(entries))
+    for index, entry in enumerate(entries):
+        entry.card_html = _lazy_html(lambda index=index: cards()[index])
+    return entries
+
+
+def _load_body(entry):
+    key = fragment_key("body", entry)
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string(BODY_TEMPLATE, {"entry": entry})
+        cache.set(key, html, FRAGMENT_TIMEOUT)
+    return mark_safe(html)
+
+
+def render_body(entry):
+    """The detail page's entry body HTML (lazy), from the cache when possible."""
+    return _lazy_html(lambda: _load_body(entry))
+
+
+def forget_fragments(entry):
+    """Deletes the fragments cached for `entry` in its current state."""
+    cache.delete_many([fragment_key(kind, entry) for kind in ("card", "body")])
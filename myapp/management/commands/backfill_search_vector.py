@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from myapp.models import Entry, ENTRY_SEARCH_VECTOR
+
+
+class Command(BaseCommand):
+    help = (
+        "Populates Entry.search_vector in primary-key batches. Only rows "
+        "with an empty vector are touched unless --all is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of entries updated per statement (default: 1000).",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            dest="recompute_all",
+            help="Recompute every entry, e.g. after changing the weights.",
+        )
+
+    def handle(self, *args, batch_size, recompute_all, **options):
+        queryset = Entry.objects.all() if recompute_all else Entry.objects.filter(search_vector__isnull=True)
+        last_id = 0
+        updated = 0
+
+        # Short statements keep row locks brief and let autovacuum keep up,
+        # unlike a single UPDATE over the whole table.
+        while True:
+            ids = list(
+                queryset.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+            updated += Entry.objects.filter(id__in=ids).update(search_vector=ENTRY_SEARCH_VECTOR)
+            self.stdout.write(f"Indexed {updated} entries (last id {last_id}).")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled search vectors for {updated} entries."))
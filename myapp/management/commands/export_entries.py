@@ -0,0 +1,68 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.models import Entry
+from myapp.transfer import FORMATS, CSVEncoder, detect_format, encode_jsonl, export_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports entries as JSON Lines or CSV (see myapp.transfer), streamed "
+        "from a server-side cursor in constant memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to write, or - for stdout.")
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="Output format (default: from the file extension, else jsonl).",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Rows fetched from the cursor at a time (default: 2000).",
+        )
+        parser.add_argument(
+            "--published-only",
+            action="store_true",
+            help="Skip unpublished entries.",
+        )
+
+    def handle(self, *args, path, format, chunk_size, published_only, **options):
+        fmt = format or detect_format(path)
+        queryset = Entry.objects.filter(is_published=True) if published_only else Entry.objects.all()
+        stream = sys.stdout.buffer if path == "-" else open(path, "wb")
+        # Progress goes to stderr when the data itself goes to stdout
+        progress = self.stderr if path == "-" else self.stdout
+
+        exported = 0
+        started = time.monotonic()
+        try:
+            if fmt == "csv":
+                encoder = CSVEncoder()
+                stream.write(encoder.header())
+                encode = encoder.encode
+            else:
+                encode = encode_jsonl
+
+            for row in export_rows(queryset, chunk_size):
+                stream.write(encode(row))
+                exported += 1
+                if exported % (chunk_size * 10) == 0:
+                    elapsed = time.monotonic() - started
+                    progress.write(f"Exported {exported} entries ({exported / elapsed:.0f} rows/s).")
+        finally:
+            if path == "-":
+                stream.flush()
+            else:
+                stream.close()
+
+        elapsed = time.monotonic() - started
+        progress.write(self.style.SUCCESS(
+            f"Exported {exported} entries in {elapsed:.2f}s, "
+            f"{exported / elapsed if elapsed else 0:.0f} rows/s."
+        ))
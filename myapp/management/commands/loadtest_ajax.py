@@ -0,0 +1,149 @@
+import http.client
+import http.cookiejar
+import statistics
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from myapp.models import Entry
+
+
+# Endpoints the command can exercise
+ENDPOINTS = ("like", "search", "comment")
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-tests the AJAX endpoints (like toggle, live search, comment add) "
+        "of a running server at increasing concurrency and reports throughput "
+        "and latency. Run it once against the server with ASYNC_AJAX_VIEWS=0 "
+        "and once with ASYNC_AJAX_VIEWS=1 (under ASGI) to compare. The comment "
+        "endpoint writes real comments; like toggles cancel out in pairs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--username", required=True, help="Account used for the requests.")
+        parser.add_argument("--password", required=True)
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            choices=ENDPOINTS,
+            help="Endpoint to test; repeat for several (default: like and search).",
+        )
+        parser.add_argument(
+            "--concurrency",
+            default="10,50,100",
+            help="Comma-separated numbers of concurrent connections (default: 10,50,100).",
+        )
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=10.0,
+            help="Seconds each endpoint is hammered at each concurrency (default: 10).",
+        )
+        parser.add_argument("--term", default="day", help="Live-search term (default: day).")
+
+    def handle(self, *args, base_url, username, password, endpoint, concurrency, duration, term, **options):
+        url = urllib.parse.urlsplit(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        levels = [int(level) for level in concurrency.split(",")]
+        entry_id = Entry.published.values_list("id", flat=True).first()
+        if entry_id is None:
+            raise CommandError("No published entry to like or comment on.")
+
+        cookies, csrf_token = self.login(base_url, username, password)
+        self.headers = {
+            "Cookie": cookies,
+            "X-CSRFToken": csrf_token,
+            "X-Requested-With": "XMLHttpRequest",
+            "Referer": base_url,
+            "Content-Type": "application/x-www-form-urlencoded",
+        }
+        bodies = {
+            "like": (reverse("users:like"), {"action": "post", "likeid": entry_id}),
+            "search": (reverse("myapp:entry-live-search"), {"action": "post", "ss": term, "v": "2"}),
+            "comment": (reverse("myapp:addcomment"), {"text": "Load test comment", "entry": entry_id}),
+        }
+
+        for name in endpoint or ("like", "search"):
+            path, data = bodies[name]
+            body = urllib.parse.urlencode(data)
+            for level in levels:
+                latencies, errors, elapsed = self.run(path, body, level, duration)
+                self.report(name, level, latencies, errors, elapsed)
+
+    def login(self, base_url, username, password):
+        """Signs in through the login form; returns (Cookie header, CSRF token)."""
+        jar = http.cookiejar.CookieJar()
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+        login_url = base_url.rstrip("/") + reverse("login")
+        opener.open(login_url).read()
+        csrf_token = next((cookie.value for cookie in jar if cookie.name == "csrftoken"), "")
+        data = urllib.parse.urlencode({
+            "username": username,
+            "password": password,
+            "csrfmiddlewaretoken": csrf_token,
+        }).encode()
+        opener.open(urllib.request.Request(login_url, data, headers={"Referer": login_url})).read()
+
+        cookies = {cookie.name: cookie.value for cookie in jar}
+        if "sessionid" not in cookies:
+            raise CommandError("Login failed; check --username and --password.")
+        return "; ".join(f"{name}={value}" for name, value in cookies.items()), cookies["csrftoken"]
+
+    def run(self, path, body, concurrency, duration):
+        """
+        Keeps `concurrency` keep-alive connections busy for `duration`
+        seconds; returns (latencies, error count, elapsed seconds).
+        """
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def worker():
+            nonlocal errors
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            own, failed = [], 0
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    connection.request("POST", path, body, self.headers)
+                    response = connection.getresponse()
+                    response.read()
+                    ok = response.status == 200
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    ok = False
+                if ok:
+                    own.append(time.perf_counter() - started)
+                else:
+                    failed += 1
+            connection.close()
+            with lock:
+                latencies.extend(own)
+                errors += failed
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for _ in range(concurrency):
+                pool.submit(worker)
+        return latencies, errors, time.monotonic() - started
+
+    def report(self, name, concurrency, latencies, errors, elapsed):
+        if len(latencies) >= 2:
+            cuts = statistics.quantiles(latencies, n=100)
+            p50, p95, p99 = (cuts[49] * 1000, cuts[94] * 1000, cuts[98] * 1000)
+        else:
+            p50 = p95 = p99 = float("nan")
+        self.stdout.write(
+            f"{name:<8} c={concurrency:<4} {len(latencies) / elapsed:8.1f} req/s  "
+            f"p50 {p50:7.1f} ms  p95 {p95:7.1f} ms  p99 {p99:7.1f} ms  "
+            f"{len(latencies)} ok, {errors} errors"
+        )
@@ -0,0 +1,72 @@
+from functools import reduce
+from operator import or_
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from myapp.aggregates import reconcile_categories, reconcile_totals
+from myapp.models import Entry, Comment
+
+
+def _count_subquery(model, fk):
+    """Correlated COUNT(*) of `model` rows pointing at the outer entry."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{fk: OuterRef("pk")})
+            .order_by()
+            .values(fk)
+            .annotate(n=Count("*"))
+            .values("n")
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the denormalized total_likes / total_comments / "
+        "total_favorites counters on Entry and fixes any that drifted, "
+        "then refreshes the cached category counts and entry totals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Number of entry ids checked per UPDATE (default: 5000).",
+        )
+
+    def handle(self, *args, batch_size, **options):
+        actual = {
+            "total_likes": _count_subquery(Entry.likes.through, "entry_id"),
+            "total_favorites": _count_subquery(Entry.favorites.through, "entry_id"),
+            "total_comments": _count_subquery(Comment, "entry_id"),
+        }
+        drifted = reduce(or_, (
+            ~Q(**{field: F(f"actual_{field}")}) for field in actual
+        ))
+
+        max_id = Entry.objects.aggregate(max_id=Max("id"))["max_id"] or 0
+        fixed = 0
+
+        # Walk the primary key in fixed-size ranges so each UPDATE only locks
+        # one slice of the table and only rewrites rows that actually drifted.
+        for start in range(0, max_id, batch_size):
+            with transaction.atomic():
+                stale_ids = list(
+                    Entry.objects.filter(id__gt=start, id__lte=start + batch_size)
+                    .annotate(**{f"actual_{field}": expr for field, expr in actual.items()})
+                    .filter(drifted)
+                    .values_list("id", flat=True)
+                )
+                if stale_ids:
+                    fixed += Entry.objects.filter(id__in=stale_ids).update(**actual)
+
+        # Totals sum the per-entry counters, so refresh them afterwards
+        reconcile_categories()
+        reconcile_totals()
+
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {fixed} drifted entries."))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from myapp.writebehind import get_config, replay_orphaned_journals
+
+
+class Command(BaseCommand):
+    help = (
+        "Applies like/favourite changes left in write-behind journals by "
+        "processes that exited before flushing them. Journals of running "
+        "processes are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--journal-dir",
+            help="Journal directory (default: MEMBERSHIP_WRITE_BEHIND['JOURNAL_DIR']).",
+        )
+
+    def handle(self, *args, journal_dir, **options):
+        journal_dir = journal_dir or get_config()["JOURNAL_DIR"]
+        if not journal_dir:
+            self.stdout.write("No journal directory configured.")
+            return
+
+        replayed = replay_orphaned_journals(journal_dir)
+        self.stdout.write(self.style.SUCCESS(f"Replayed {replayed} buffered changes."))
@@ -0,0 +1,184 @@
+import json
+import platform
+import time
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.cache.backends.redis import RedisCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from daybook.cache import shared_cache
+from myapp.benchmarks import BENCH_COMMENT_TEXT, BENCH_USER_PREFIX, SEARCH_TERM, compare, summarize
+from myapp.models import Comment, Entry
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the hot read and write paths in-process against the "
+        "configured database (seed it with seed_benchmark first): each "
+        "EntryListView sort, EntryDetailView on a deep and a typical comment "
+        "tree, both search modes, like toggle and comment add. Reports p50/p95 "
+        "latency and queries per request as JSON and compares them with a "
+        "saved baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50, help="Measured requests per scenario (default: 50).")
+        parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests first (default: 5).")
+        parser.add_argument(
+            "--cold",
+            action="store_true",
+            help="Clear the cache before every request instead of measuring warm caches.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Allow --cold to clear a Redis shared cache (FLUSHDB on its whole database).",
+        )
+        parser.add_argument("--scenario", action="append", help="Only run these scenarios (repeatable).")
+        parser.add_argument("--output", help="Write the results JSON to this file.")
+        parser.add_argument("--baseline", help="Results JSON to compare against.")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.2,
+            help="Fractional latency growth counted as a regression (default: 0.2).",
+        )
+        parser.add_argument(
+            "--fail-on-regression",
+            action="store_true",
+            help="Exit with an error when the comparison finds a regression.",
+        )
+
+    def handle(self, *args, iterations, warmup, cold, force, scenario, output, baseline, threshold,
+               fail_on_regression, **options):
+        # Redis clears with FLUSHDB, taking sessions, rate-limit counters and
+        # anything else stored in that database with it
+        if cold and isinstance(shared_cache().backend, RedisCache) and not force:
+            raise CommandError(
+                "--cold would flush the shared Redis database. Point REDIS_URL at "
+                "a database used only for benchmarking, or pass --force."
+            )
+        scenarios = self.build_scenarios()
+        unknown = set(scenario or ()) - scenarios.keys()
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}. Choose from {', '.join(scenarios)}.")
+
+        results = {
+            "meta": {
+                "created_at": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "iterations": iterations,
+                "cold": cold,
+                "entries": Entry.objects.count(),
+                "comments": Comment.objects.count(),
+            },
+            "results": {},
+        }
+        try:
+            for name, request in scenarios.items():
+                if scenario and name not in scenario:
+                    continue
+                results["results"][name] = self.measure(request, iterations, warmup, cold)
+                self.report(name, results["results"][name])
+        finally:
+            # Leave the fixture as seeded
+            Comment.objects.filter(author=self.user, text=BENCH_COMMENT_TEXT).delete()
+
+        if output:
+            with open(output, "w") as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(f"Results written to {output}.")
+
+        if baseline:
+            with open(baseline) as file:
+                regressions = self.compare(results, json.load(file), threshold)
+            if regressions and fail_on_regression:
+                raise CommandError(f"{regressions} regressions against {baseline}.")
+
+    def build_scenarios(self):
+        """Maps scenario names to callables making one request with self.client."""
+        self.user = (
+            get_user_model().objects.filter(username__startswith=BENCH_USER_PREFIX)
+            .order_by("id").first()
+        )
+        entries = Entry.published.filter(author__username__startswith=BENCH_USER_PREFIX)
+        deep = entries.order_by("-total_comments").first()
+        if self.user is None or deep is None:
+            raise CommandError("No benchmark fixture found; run seed_benchmark first.")
+        # The median entry by comment count stands in for a typical page
+        typical = entries.order_by("total_comments")[entries.count() // 2]
+
+        # localhost passes ALLOWED_HOSTS under DEBUG; an address outside
+        # INTERNAL_IPS keeps debug_toolbar from instrumenting the requests
+        self.client = Client(HTTP_HOST="localhost", REMOTE_ADDR="192.0.2.1")
+        self.client.force_login(self.user)
+        ajax = {"headers": {"X-Requested-With": "XMLHttpRequest"}}
+        list_url = reverse("myapp:entry-list")
+
+        scenarios = {
+            f"list_{sort}": (lambda sort=sort: self.client.get(list_url, {"sort": sort}))
+            for sort in ("new", "old", "popular", Entry.Category.values[0])
+        }
+        scenarios.update({
+            "list_page_3": lambda: self.client.get(list_url, {"sort": "new", "page": 3}),
+            "detail_deep": lambda: self.client.get(deep.get_absolute_url()),
+            "detail_typical": lambda: self.client.get(typical.get_absolute_url()),
+            "search_page": lambda: self.client.get(reverse("myapp:entry-search"), {"q": SEARCH_TERM}),
+            "search_live": lambda: self.client.post(
+                reverse("myapp:entry-live-search"), {"action": "post", "ss": SEARCH_TERM, "v": "2"},
+            ),
+            "like_toggle": lambda: self.client.post(
+                reverse("users:like"), {"action": "post", "likeid": typical.id},
+            ),
+            "comment_add": lambda: self.client.post(
+                reverse("myapp:addcomment"), {"text": BENCH_COMMENT_TEXT, "entry": typical.id}, **ajax,
+            ),
+        })
+        return scenarios
+
+    def measure(self, request, iterations, warmup, cold):
+        for _ in range(warmup):
+            request()
+
+        latencies, queries, errors = [], [], 0
+        for _ in range(iterations):
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = request()
+                latencies.append(time.perf_counter() - started)
+            queries.append(len(captured.captured_queries))
+            if response.status_code >= 400:
+                errors += 1
+        return summarize(latencies, queries, errors)
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<16} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+            f"{result['queries']:5.1f} queries  {result['errors']} errors"
+        )
+
+    def compare(self, results, baseline, threshold):
+        """Prints every metric against the baseline; returns the number of regressions."""
+        regressions = 0
+        self.stdout.write(f"\nAgainst baseline from {baseline['meta'].get('created_at', '?')}:")
+        for name, metric, before, after, regressed in compare(results, baseline, threshold):
+            change = (after - before) / before * 100 if before else 0.0
+            line = f"{name:<16} {metric:<8} {before:9.2f} -> {after:9.2f} ({change:+6.1f}%)"
+            if regressed:
+                regressions += 1
+                line = self.style.ERROR(f"{line}  REGRESSION")
+            self.stdout.write(line)
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS("No regressions."))
+        return regressions
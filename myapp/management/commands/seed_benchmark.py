@@ -0,0 +1,204 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from myapp.benchmarks import BENCH_USER_PREFIX, VOCABULARY, Zipf, words
+from myapp.models import Comment, Entry
+from myapp.versions import touch_all_lists
+from users.models import Profile
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates a reproducible benchmark fixture: users, entries, comment "
+        "trees, likes and favourites with Zipf-skewed popularity (see "
+        "myapp.benchmarks). Users are named bench_<n> and share one password."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--entries", type=int, default=5000)
+        parser.add_argument("--comments", type=int, default=20000)
+        parser.add_argument("--likes", type=int, default=50000)
+        parser.add_argument(
+            "--deep-entries",
+            type=int,
+            default=3,
+            help="Entries given large, maximally deep comment trees (default: 3).",
+        )
+        parser.add_argument(
+            "--deep-comments",
+            type=int,
+            default=500,
+            help="Comments on each deep entry (default: 500).",
+        )
+        parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42).")
+        parser.add_argument("--password", default="benchmark", help="Password of every bench user.")
+        parser.add_argument(
+            "--flush",
+            action="store_true",
+            help="Delete the existing bench users (and everything they own) first.",
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.words = Zipf(len(VOCABULARY), rng=self.rng)
+        started = time.monotonic()
+
+        if options["flush"]:
+            deleted, _ = get_user_model().objects.filter(username__startswith=BENCH_USER_PREFIX).delete()
+            self.stdout.write(f"Deleted {deleted} existing bench rows.")
+
+        with transaction.atomic():
+            user_ids = self.create_users(options["users"], options["password"])
+            entry_ids = self.create_entries(user_ids, options["entries"])
+            self.create_comments(user_ids, entry_ids, options)
+            self.create_memberships(user_ids, entry_ids, options["likes"])
+
+        # bulk_create bypasses the counter signals and the cached aggregates.
+        # New rows have new ids, so only the list validators go stale; the
+        # cache is not cleared, which on Redis would flush the whole database
+        call_command("reconcile_entry_counters", stdout=self.stdout)
+        touch_all_lists()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(user_ids)} users, {len(entry_ids)} entries in "
+            f"{time.monotonic() - started:.1f}s."
+        ))
+
+    def create_users(self, count, password):
+        User = get_user_model()
+        start = User.objects.filter(username__startswith=BENCH_USER_PREFIX).count()
+        hashed = make_password(password)
+        users = User.objects.bulk_create(
+            User(
+                username=f"{BENCH_USER_PREFIX}{start + n}",
+                email=f"{BENCH_USER_PREFIX}{start + n}@example.com",
+                password=hashed,
+            )
+            for n in range(count)
+        )
+        Profile.objects.bulk_create(Profile(user=user, is_verified=True) for user in users)
+        return [user.id for user in users]
+
+    def create_entries(self, user_ids, count):
+        """Entries by Zipf-chosen authors, spread over the past year."""
+        authors = Zipf(len(user_ids), rng=self.rng)
+        categories = Entry.Category.values
+        entries = Entry.objects.bulk_create(
+            (
+                Entry(
+                    title=words(self.words, self.rng.randint(2, 8)).capitalize()[:100].ljust(4, "."),
+                    text=words(self.words, self.rng.randint(30, 400)),
+                    category=self.rng.choice(categories),
+                    author_id=user_ids[authors()],
+                    is_published=self.rng.random() < 0.95,
+                )
+                for _ in range(count)
+            ),
+            batch_size=1000,
+        )
+        # auto_now_add stamped every row with the same moment; spread them
+        # with the seeded rng so --seed reproduces the created_at order
+        now = timezone.now()
+        for entry in entries:
+            entry.created_at = now - timedelta(days=365 * self.rng.random())
+        Entry.objects.bulk_update(entries, ["created_at"], batch_size=1000)
+        return [entry.id for entry in entries]
+
+    def create_comments(self, user_ids, entry_ids, options):
+        """
+        Comment trees: a Zipf share of `comments` per entry, plus the deep
+        entries with maximally nested threads. Nested-set fields are
+        computed here and rows inserted level by level (each level needs
+        its parents' ids), since bulk_create skips MPTT's bookkeeping.
+        """
+        authors = Zipf(len(user_ids), rng=self.rng)
+        popular = Zipf(len(entry_ids), rng=self.rng)
+        per_entry = {}
+        for _ in range(options["comments"]):
+            entry_id = entry_ids[popular()]
+            per_entry[entry_id] = per_entry.get(entry_id, 0) + 1
+        for entry_id in entry_ids[:options["deep_entries"]]:
+            per_entry[entry_id] = per_entry.get(entry_id, 0) + options["deep_comments"]
+        deep = set(entry_ids[:options["deep_entries"]])
+
+        tree_id = (Comment.objects.aggregate(max_tree=Max("tree_id"))["max_tree"] or 0) + 1
+        levels = [[] for _ in range(Comment.MAX_DEPTH + 1)]
+        for entry_id, count in per_entry.items():
+            # Deep entries reply to the newest comments, making long chains
+            reply_chance = 0.85 if entry_id in deep else 0.5
+            nodes = []
+            for _ in range(count):
+                parent = None
+                if nodes and self.rng.random() < reply_chance:
+                    pool = nodes[-5:] if entry_id in deep else nodes
+                    parent = self.rng.choice(pool)
+                    if parent["level"] >= Comment.MAX_DEPTH:
+                        parent = parent["parent"]
+                node = {
+                    "parent": parent,
+                    "children": [],
+                    "level": 0 if parent is None else parent["level"] + 1,
+                    "obj": Comment(
+                        entry_id=entry_id,
+                        author_id=user_ids[authors()],
+                        text=words(self.words, self.rng.randint(3, 40)),
+                        is_published=True,
+                    ),
+                }
+                if parent is not None:
+                    parent["children"].append(node)
+                nodes.append(node)
+
+            for root in (node for node in nodes if node["parent"] is None):
+                self.number_tree(root, tree_id)
+                tree_id += 1
+            for node in nodes:
+                levels[node["level"]].append(node)
+
+        for level in levels:
+            for node in level:
+                node["obj"].parent = node["parent"]["obj"] if node["parent"] else None
+            Comment.objects.bulk_create([node["obj"] for node in level], batch_size=1000)
+
+    def number_tree(self, root, tree_id):
+        """Assigns tree_id/lft/rght/level to a tree of nodes (iterative DFS)."""
+        counter = 1
+        stack = [(root, False)]
+        while stack:
+            node, done = stack.pop()
+            comment = node["obj"]
+            if done:
+                comment.rght = counter
+                counter += 1
+                continue
+            comment.tree_id, comment.level, comment.lft = tree_id, node["level"], counter
+            counter += 1
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node["children"]))
+
+    def create_memberships(self, user_ids, entry_ids, likes):
+        """Likes on Zipf-popular entries by Zipf-active users; a fifth also favourite."""
+        users = Zipf(len(user_ids), rng=self.rng)
+        popular = Zipf(len(entry_ids), rng=self.rng)
+        pairs = {(entry_ids[popular()], user_ids[users()]) for _ in range(likes)}
+        Like, Favorite = Entry.likes.through, Entry.favorites.through
+        Like.objects.bulk_create(
+            (Like(entry_id=entry_id, user_id=user_id) for entry_id, user_id in pairs),
+            batch_size=5000,
+            ignore_conflicts=True,
+        )
+        Favorite.objects.bulk_create(
+            (Favorite(entry_id=entry_id, user_id=user_id) for entry_id, user_id in pairs if self.rng.random() < 0.2),
+            batch_size=5000,
+            ignore_conflicts=True,
+        )
@@ -0,0 +1,225 @@
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+from django.db import connection
+from django.db.models import Value
+
+from daybook.cache import shared_cache
+
+from .models import Entry
+from .pagecache import purge_entries
+from .versions import touch_entries
+
+
+# Entry M2M relations a user can toggle, with the counter each one feeds
+RELATIONS = {
+    "likes": (Entry.likes.through, "total_likes"),
+    "favorites": (Entry.favorites.through, "total_favorites"),
+}
+
+ToggleResult = namedtuple("ToggleResult", ["entry_id", "title", "active", "count"])
+MembershipSets = namedtuple("MembershipSets", ["liked", "favorited"])
+
+# Seconds a user's cached like/favourite id sets live; changes evict them.
+# Kept in the shared cache only, so no worker serves a set from its L1
+# after the eviction (the detail/list ETags assume fresh sets)
+MEMBERSHIP_SET_TIMEOUT = 60 * 60
+# Users with more likes + favourites than this are not cached; their pages
+# run the batch query instead
+MEMBERSHIP_SET_MAX = 5000
+
+
+_TOGGLE_SQL = """
+WITH target AS (
+    SELECT {entry_id}, {title} FROM {entry_table} WHERE {lookup} = %(value)s AND {published}
+),
+removed AS (
+    DELETE FROM {through} t USING target
+    WHERE t.{through_entry} = target.{entry_id} AND t.{through_user} = %(user_id)s
+    RETURNING t.{through_entry}
+),
+added AS (
+    INSERT INTO {through} ({through_entry}, {through_user})
+    SELECT target.{entry_id}, %(user_id)s FROM target
+    WHERE NOT EXISTS (SELECT 1 FROM removed)
+    ON CONFLICT ({through_entry}, {through_user}) DO NOTHING
+    RETURNING {through_entry}
+),
+counter AS (
+    UPDATE {entry_table} e
+    SET {counter} = GREATEST(
+        e.{counter} + (SELECT COUNT(*) FROM added) - (SELECT COUNT(*) FROM removed), 0
+    )
+    FROM target WHERE e.{entry_id} = target.{entry_id}
+    RETURNING e.{counter}
+)
+SELECT target.{entry_id}, target.{title}, NOT EXISTS (SELECT 1 FROM removed),
+       (SELECT {counter} FROM counter)
+FROM target
+"""
+
+
+def _toggle_sql(relation, lookup):
+    through, counter = RELATIONS[relation]
+    qn = connection.ops.quote_name
+    entry_opts = Entry._meta
+    return _TOGGLE_SQL.format(
+        entry_table=qn(entry_opts.db_table),
+        entry_id=qn(entry_opts.pk.column),
+        title=qn(entry_opts.get_field("title").column),
+        lookup=qn(entry_opts.get_field(lookup).column),
+        published=qn(entry_opts.get_field("is_published").column),
+        counter=qn(entry_opts.get_field(counter).column),
+        through=qn(through._meta.db_table),
+        through_entry=qn(through._meta.get_field("entry").column),
+        through_user=qn(through._meta.get_field("user").column),
+    )
+
+
+def toggle_membership(relation, user_id, **lookup):
+    """
+    Flips a user's like/favourite on an entry in a single statement.
+
+    `relation` is 'likes' or 'favorites'; the entry is selected by exactly
+    one keyword, `id` or `public_id`. One data-modifying CTE deletes the
+    (entry, user) row if it exists, otherwise inserts it with ON CONFLICT
+    DO NOTHING, moves the entry's denormalized counter by the rows actually
+    changed and returns the new count — one round trip, and concurrent
+    double-clicks can neither duplicate a row nor skew the counter.
+
+    Bypasses m2m_changed (the counter is updated in the same statement).
+
+    Returns a ToggleResult(entry_id, title, active, count), or None when no
+    published entry matches.
+    """
+    (field, value), = lookup.items()
+    with connection.cursor() as cursor:
+        cursor.execute(_toggle_sql(relation, field), {"value": value, "user_id": user_id})
+        row = cursor.fetchone()
+    return ToggleResult(*row) if row else None
+
+
+def toggle(relation, user_id, **lookup):
+    """
+    Toggle entry point for the views: records the change in the
+    write-behind buffer when settings.MEMBERSHIP_WRITE_BEHIND is enabled
+    (the returned count is then a projection), otherwise writes it now
+    with toggle_membership(). Either way the user's cached membership sets
+    are dropped, the entry is marked changed for conditional GETs and its
+    anonymous cached pages are purged.
+    """
+    from .writebehind import get_buffer
+
+    buffer = get_buffer()
+    if buffer is not None:
+        result = buffer.toggle(relation, user_id, **lookup)
+    else:
+        result = toggle_membership(relation, user_id, **lookup)
+    invalidate_memberships([user_id])
+    if result is not None:
+        touch_entries([result.entry_id])
+        purge_entries([result.entry_id])
+    return result
+
+
+def membership_key(user_id):
+    # v2: ids packed as 8-byte ints (v1 payloads used 4)
+    return f"membership:v2:{user_id}"
+
+
+def invalidate_memberships(user_ids):
+    shared_cache().delete_many([membership_key(user_id) for user_id in user_ids])
+
+
+def _membership_rows(user_id, entry_ids=None):
+    """
+    (relation, entry_id) pairs of a user's likes and favourites, limited to
+    `entry_ids` when given, from one UNION ALL query.
+    """
+    querysets = []
+    for relation, (through, _) in RELATIONS.items():
+        queryset = through.objects.filter(user_id=user_id)
+        if entry_ids is not None:
+            queryset = queryset.filter(entry_id__in=entry_ids)
+        querysets.append(
+            queryset.order_by().annotate(relation=Value(relation)).values_list("relation", "entry_id")
+        )
+    first, *rest = querysets
+    return first.union(*rest, all=True)
+
+
+def _cached_memberships(user_id):
+    """
+    {relation: sorted array of entry ids} for a user, or None when the user
+    has more than MEMBERSHIP_SET_MAX memberships. Cached as packed unsigned
+    64-bit ints (8 bytes per id, wide enough for any bigint key) and probed
+    with bisect.
+    """
+    key = membership_key(user_id)
+    packed = shared_cache().get(key)
+    if packed is None:
+        rows = list(_membership_rows(user_id)[:MEMBERSHIP_SET_MAX + 1])
+        if len(rows) > MEMBERSHIP_SET_MAX:
+            packed = False
+        else:
+            packed = {relation: [] for relation in RELATIONS}
+            for relation, entry_id in rows:
+                packed[relation].append(entry_id)
+            packed = {
+                relation: array("Q", sorted(ids)).tobytes() for relation, ids in packed.items()
+            }
+        shared_cache().set(key, packed, MEMBERSHIP_SET_TIMEOUT)
+    if packed is False:
+        return None
+
+    sets = {}
+    for relation, data in packed.items():
+        ids = array("Q")
+        ids.frombytes(data)
+        sets[relation] = ids
+    return sets
+
+
+def _contains(sorted_ids, entry_id):
+    index = bisect_left(sorted_ids, entry_id)
+    return index < len(sorted_ids) and sorted_ids[index] == entry_id
+
+
+def get_memberships(user, entry_ids, cached=True):
+    """
+    Returns MembershipSets(liked, favorited): the ids among `entry_ids`
+    that `user` has liked / favourited.
+
+    Reads the user's cached compact id sets when `cached` (one cache get,
+    no query), otherwise — or for users with very many memberships — runs
+    one query for just these entries. Changes still waiting in the
+    write-behind buffer are applied on top.
+    """
+    entry_ids = set(entry_ids)
+    found = {relation: set() for relation in RELATIONS}
+    if not user.is_authenticated or not entry_ids:
+        return MembershipSets(found["likes"], found["favorites"])
+
+    sets = _cached_memberships(user.id) if cached else None
+    if sets is not None:
+        for relation, ids in sets.items():
+            found[relation] = {entry_id for entry_id in entry_ids if _contains(ids, entry_id)}
+    else:
+        for relation, entry_id in _membership_rows(user.id, entry_ids):
+            found[relation].add(entry_id)
+
+    from .writebehind import get_buffer
+
+    buffer = get_buffer()
+    if buffer is not None:
+        for relation in RELATIONS:
+            for entry_id, active in buffer.pending_states(user.id, relation).items():
+                if entry_id not in entry_ids:
+                    continue
+                if active:
+                    found[relation].add(entry_id)
+                else:
+                    found[relation].discard(entry_id)
+
+    return MembershipSets(found["likes"], found["favorites"])
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0008_alter_entry_category_alter_entry_managers_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entry',
+            name='total_comments',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='entry',
+            name='total_favorites',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='entry',
+            name='total_likes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE myapp_entry e SET
+                    total_likes = (SELECT COUNT(*) FROM myapp_entry_likes l WHERE l.entry_id = e.id),
+                    total_favorites = (SELECT COUNT(*) FROM myapp_entry_favorites f WHERE f.entry_id = e.id),
+                    total_comments = (SELECT COUNT(*) FROM myapp_comment c WHERE c.entry_id = e.id);
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
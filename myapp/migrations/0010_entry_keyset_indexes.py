@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0009_entry_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='entry',
+            name='myapp_entry_categor_763467_idx',
+        ),
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(fields=['category', 'is_published', '-created_at'], name='myapp_entry_categor_e0977a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(fields=['is_published', '-total_likes', '-total_comments', '-id'], name='myapp_entry_is_publ_6b19bc_idx'),
+        ),
+    ]
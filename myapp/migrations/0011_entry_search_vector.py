@@ -0,0 +1,48 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:27
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0010_entry_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entry',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='entry',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='myapp_entry_search_gin'),
+        ),
+        # Keep search_vector in step with myapp.models.ENTRY_SEARCH_VECTOR.
+        # Existing rows are filled by the backfill_search_vector command.
+        migrations.RunSQL(
+            sql="""
+                CREATE FUNCTION myapp_entry_search_vector_update() RETURNS trigger AS $$
+                BEGIN
+                    NEW.search_vector :=
+                        setweight(to_tsvector('english'::regconfig, COALESCE(NEW.title, '')), 'A') ||
+                        setweight(to_tsvector('english'::regconfig, COALESCE(NEW.text, '')), 'B');
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql;
+
+                CREATE TRIGGER myapp_entry_search_vector_trigger
+                BEFORE INSERT OR UPDATE OF title, text ON myapp_entry
+                FOR EACH ROW EXECUTE FUNCTION myapp_entry_search_vector_update();
+            """,
+            reverse_sql="""
+                DROP TRIGGER IF EXISTS myapp_entry_search_vector_trigger ON myapp_entry;
+                DROP FUNCTION IF EXISTS myapp_entry_search_vector_update();
+            """,
+        ),
+    ]
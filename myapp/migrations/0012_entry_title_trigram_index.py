@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:28
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0011_entry_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='entry',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['title'], name='myapp_entry_title_trgm', opclasses=['gist_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:30
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0012_entry_title_trigram_index'),
+    ]
+
+    # Comments were never marked published when posted, but every one of
+    # them was displayed. The detail page now only shows published comments
+    # (and new ones are published on creation), so keep existing threads
+    # visible.
+    operations = [
+        migrations.RunSQL(
+            sql="UPDATE myapp_comment SET is_published = TRUE WHERE is_published = FALSE;",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
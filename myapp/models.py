@@ -1,14 +1,25 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex, GistIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.urls import reverse
 from mptt.models import MPTTModel, TreeForeignKey
-from django.db.models import Count
 import uuid
 from django.core.validators import MinLengthValidator
 from django.core.exceptions import ValidationError
 
 User = get_user_model()
 
+# Text search configuration shared by the stored vector and every query
+SEARCH_CONFIG = "english"
+
+# Weighted document stored in Entry.search_vector: title ranks above text.
+# Must stay in sync with the trigger function in migration 0011.
+ENTRY_SEARCH_VECTOR = (
+    SearchVector("title", weight="A", config=SEARCH_CONFIG)
+    + SearchVector("text", weight="B", config=SEARCH_CONFIG)
+)
+
 
 class EntryManager(models.Manager):
     def get_queryset(self):
@@ -16,10 +27,6 @@ class EntryManager(models.Manager):
         super().get_queryset()
         .filter(is_published=True)
         .select_related('author__profile')
-        .annotate(
-            total_comments=Count('comments', distinct=True),
-            total_likes=Count('likes', distinct=True),
-        )
     )
 
     
@@ -74,6 +81,17 @@ class Entry(models.Model):
 
     is_published = models.BooleanField(default=False)
 
+    # Denormalized counters, maintained by myapp.signals and reconciled by
+    # the reconcile_entry_counters management command.
+    total_likes = models.PositiveIntegerField(default=0, editable=False)
+    total_comments = models.PositiveIntegerField(default=0, editable=False)
+    total_favorites = models.PositiveIntegerField(default=0, editable=False)
+
+    # Precomputed ENTRY_SEARCH_VECTOR, kept current on INSERT and on UPDATE
+    # of title/text by a database trigger; backfill_search_vector fills
+    # rows written before the trigger existed.
+    search_vector = SearchVectorField(null=True, editable=False)
+
     published = EntryManager()
     objects = models.Manager()
 
@@ -82,11 +100,23 @@ class Entry(models.Model):
         indexes = [
             models.Index(fields=["is_published", "-created_at"]),
             models.Index(fields=["author", "is_published"]),
-            models.Index(fields=["category", "is_published"]),
+            models.Index(fields=["category", "is_published", "-created_at"]),
+            models.Index(fields=["is_published", "-total_likes", "-total_comments", "-id"]),
+            GinIndex(fields=["search_vector"], name="myapp_entry_search_gin"),
+            # Trigram KNN index for title autocomplete (see myapp.search)
+            GistIndex(fields=["title"], opclasses=["gist_trgm_ops"], name="myapp_entry_title_trgm"),
         ]
 
     def __str__(self):
         return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded state so signal receivers can tell what a
+        # later save() changed (see myapp.signals)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
     
     def get_absolute_url(self):
         return reverse("myapp:entry-detail", kwargs={"public_id": self.public_id})
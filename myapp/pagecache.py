@@ -0,0 +1,180 @@
+"""
+Full-response cache for anonymous visitors to the public entry pages.
+
+Anonymous pages are the same for everyone, so a complete rendered response
+is stored in the shared cache and replayed without touching the entry,
+comment or membership queries. Only the query parameters a view declares
+are part of the key; anything else (tracking parameters and the like)
+maps to the same page.
+
+The key also holds the view's page version (for entries, the change
+version from myapp.versions), read before the page is rendered. A change
+moves readers to a new key, so a page rendered from data older than the
+change, even one stored after the purge, is never served.
+
+Each stored page is listed under its surrogate keys (e.g. "entry-42") in
+an index entry, and purge() deletes every page listed under a key. Signals
+purge an entry's pages when it, its comments or its likes change. The
+index is updated without a lock, so a concurrent store can drop a page
+from it; purging only frees memory early and is not what keeps pages
+fresh. Responses carry the keys in a Surrogate-Key header and report
+X-Cache: HIT or MISS for the load balancer.
+"""
+import hashlib
+from urllib.parse import urlencode
+
+from django.contrib import messages
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import parse_http_date_safe
+
+from daybook.cache import bypass_l1, shared_cache
+
+
+# Seconds an anonymous page stays cached without a purge
+PAGE_CACHE_TIMEOUT = 10 * 60
+# Pages indexed per surrogate key; further variants are served uncached so
+# arbitrary query strings cannot grow an index without bound
+PAGE_CACHE_MAX_VARIANTS = 50
+
+# Response headers replayed on a hit
+_STORED_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Cache-Control", "Vary", "Surrogate-Key")
+
+
+def page_key(request, params, version=""):
+    query = urlencode(sorted((name, request.GET[name]) for name in params if name in request.GET))
+    digest = hashlib.md5(f"{request.path}?{query}#{version}".encode()).hexdigest()
+    return f"page:{digest}"
+
+
+def surrogate_index_key(surrogate_key):
+    return f"surrogate:{surrogate_key}"
+
+
+def entry_surrogate_key(entry_id):
+    return f"entry-{entry_id}"
+
+
+def get_page(key):
+    """The cached response stored under `key`, or None."""
+    stored = shared_cache().get(key)
+    if stored is None:
+        return None
+    content, headers = stored
+    response = HttpResponse(content)
+    for name, value in headers:
+        response[name] = value
+    return response
+
+
+def store_page(key, response, surrogate_keys):
+    """
+    Caches `response` and lists it under each surrogate key. Returns False
+    (caching nothing) when a key already indexes too many variants.
+    """
+    cache = shared_cache()
+    index_keys = [surrogate_index_key(surrogate_key) for surrogate_key in surrogate_keys]
+    indexes = cache.get_many(index_keys)
+    for index_key in index_keys:
+        pages = indexes.setdefault(index_key, [])
+        if key not in pages:
+            if len(pages) >= PAGE_CACHE_MAX_VARIANTS:
+                return False
+            pages.append(key)
+
+    headers = [(name, response[name]) for name in _STORED_HEADERS if response.has_header(name)]
+    # The index outlives its pages so a purge always finds them
+    cache.set_many(indexes, PAGE_CACHE_TIMEOUT * 2)
+    cache.set(key, (response.content, headers), PAGE_CACHE_TIMEOUT)
+    return True
+
+
+def purge(surrogate_keys):
+    """Deletes every cached page listed under the given surrogate keys."""
+    cache = shared_cache()
+    index_keys = [surrogate_index_key(surrogate_key) for surrogate_key in surrogate_keys]
+    if not index_keys:
+        return
+    pages = [key for keys in cache.get_many(index_keys).values() for key in keys]
+    cache.delete_many(pages + index_keys)
+
+
+def purge_entries(entry_ids):
+    purge([entry_surrogate_key(entry_id) for entry_id in entry_ids if entry_id is not None])
+
+
+class AnonymousPageCacheMixin:
+    """
+    Serves GET requests from anonymous users out of the page cache.
+
+    The view lists the query parameters its output depends on in
+    page_cache_params, returns the version of the data the page shows
+    from get_page_version() (None skips the cache) and the response's
+    surrogate keys from get_surrogate_keys(). Only 200 responses that
+    set no cookies are stored, and nothing here writes the session;
+    requests with flash messages waiting bypass the cache. Misses are rendered with the
+    TieredCache L1 bypassed (see daybook.cache.bypass_l1), so a page
+    rebuilt right after a purge sees the same data the purge did.
+    """
+
+    page_cache_params = ()
+
+    def get_page_version(self):
+        return ""
+
+    def get_surrogate_keys(self):
+        return []
+
+    def is_cacheable(self, request, response):
+        """
+        True for a plain 200 that is the same for every anonymous visitor:
+        no cookies (including a CSRF cookie about to be set for a form on
+        the page) and no session changes.
+        """
+        session = getattr(request, "session", None)
+        return (
+            response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and not request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+            and not (session is not None and session.modified)
+        )
+
+    def dispatch(self, request, *args, **kwargs):
+        if (
+            request.method not in ("GET", "HEAD")
+            or request.user.is_authenticated
+            or len(messages.get_messages(request))
+        ):
+            return super().dispatch(request, *args, **kwargs)
+
+        # Read before rendering: a change during the render bumps the
+        # version, so this page is stored under a key no one reads again
+        version = self.get_page_version()
+        if version is None:
+            return super().dispatch(request, *args, **kwargs)
+        key = page_key(request, self.page_cache_params, version)
+        response = get_page(key)
+        if response is not None:
+            response = get_conditional_response(
+                request,
+                etag=response.get("ETag"),
+                last_modified=parse_http_date_safe(response.get("Last-Modified", "")),
+                response=response,
+            )
+            response["X-Cache"] = "HIT"
+            return response
+
+        # The page may be served for PAGE_CACHE_TIMEOUT, so build it from
+        # the shared cache only, never from this worker's possibly stale L1
+        with bypass_l1():
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, "render"):
+                response.render()
+        if self.is_cacheable(request, response):
+            surrogate_keys = self.get_surrogate_keys()
+            response["Surrogate-Key"] = " ".join(surrogate_keys)
+            patch_cache_control(response, public=True)
+            store_page(key, response, surrogate_keys)
+        response["X-Cache"] = "MISS"
+        return response
@@ -0,0 +1,173 @@
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+
+
+# Salt for signing pagination cursors (keeps them opaque and tamper-proof)
+CURSOR_SALT = "myapp.pagination.cursor"
+
+
+class CursorPage:
+    """
+    One page of keyset-paginated results.
+
+    Mirrors the parts of django.core.paginator.Page that templates use
+    (iteration, has_next/has_previous), but navigation is done through
+    opaque cursors instead of page numbers, so no COUNT(*) is ever needed.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset paginator: seeks past the last row seen instead of using OFFSET.
+
+    The queryset's order_by() defines the key, e.g. ("-created_at",) or
+    ("-total_likes", "-total_comments"). The primary key is appended as a
+    tie-breaker when missing so every row has a unique position. Cursors are
+    signed and encode the key values of the boundary row plus a direction.
+    """
+
+    def __init__(self, queryset, per_page, ordering=None):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        ordering = list(ordering or queryset.query.order_by or queryset.model._meta.ordering)
+
+        pk_name = queryset.model._meta.pk.name
+        if not ordering or ordering[-1].lstrip("-") not in (pk_name, "pk"):
+            descending = bool(ordering) and ordering[-1].startswith("-")
+            ordering.append(f"-{pk_name}" if descending else pk_name)
+
+        self.ordering = ordering
+        self.keys = [
+            (name.lstrip("-"), name.startswith("-")) for name in ordering
+        ]
+
+    def encode_cursor(self, obj, direction):
+        values = [
+            self._get_field(name).value_to_string(obj) for name, _ in self.keys
+        ]
+        return signing.dumps({"d": direction, "v": values}, salt=CURSOR_SALT, compress=True)
+
+    def decode_cursor(self, cursor):
+        """
+        Returns (direction, values) from a signed cursor.
+
+        Raises Http404 for forged, truncated or mismatched cursors, the
+        same way Django's paginator handles an invalid page number.
+        """
+        try:
+            payload = signing.loads(cursor, salt=CURSOR_SALT)
+            direction, raw_values = payload["d"], payload["v"]
+            if direction not in ("next", "prev") or len(raw_values) != len(self.keys):
+                raise ValueError
+            values = [
+                self._get_field(name).to_python(value)
+                for (name, _), value in zip(self.keys, raw_values)
+            ]
+        except (signing.BadSignature, KeyError, TypeError, ValueError, ValidationError):
+            raise Http404("Invalid cursor.")
+        return direction, values
+
+    def page(self, cursor=None):
+        """
+        Returns the CursorPage following (or preceding) the given cursor.
+
+        Fetches per_page + 1 rows to learn whether another page exists
+        without counting the full result set.
+        """
+        direction, values = self.decode_cursor(cursor) if cursor else ("next", None)
+        backwards = direction == "prev"
+
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, backwards))
+
+        ordering = self._flip(self.ordering) if backwards else self.ordering
+        rows = list(queryset.order_by(*ordering)[: self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if backwards:
+            rows.reverse()
+
+        if not rows:
+            return CursorPage(rows)
+
+        has_next = has_more if not backwards else True
+        has_previous = has_more if backwards else values is not None
+        return CursorPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1], "next") if has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], "prev") if has_previous else None,
+        )
+
+    def _seek(self, values, backwards):
+        """
+        Builds the row-value comparison (k1, k2, ...) > (v1, v2, ...) as
+        nested ORs, plus a redundant bound on the leading key so Postgres
+        can start an index range scan at the boundary row.
+        """
+        def op(descending, inclusive=False):
+            forward = descending == backwards  # True means "greater than"
+            return ("gte" if inclusive else "gt") if forward else ("lte" if inclusive else "lt")
+
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.keys, values):
+            condition |= equal & Q(**{f"{name}__{op(descending)}": value})
+            equal &= Q(**{name: value})
+
+        first_name, first_descending = self.keys[0]
+        leading = Q(**{f"{first_name}__{op(first_descending, inclusive=True)}": values[0]})
+        return leading & condition
+
+    def _get_field(self, name):
+        opts = self.queryset.model._meta
+        return opts.pk if name == "pk" else opts.get_field(name)
+
+    @staticmethod
+    def _flip(ordering):
+        return [name[1:] if name.startswith("-") else f"-{name}" for name in ordering]
+
+
+class CursorPaginationMixin:
+    """
+    Opt-in keyset pagination for ListView subclasses.
+
+    Requests carrying the cursor query parameter (an empty value means the
+    first page) are paginated with CursorPaginator; all other requests keep
+    the regular ?page=N OFFSET pagination.
+    """
+
+    cursor_query_param = "cursor"
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.cursor_query_param not in self.request.GET:
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = CursorPaginator(queryset, page_size)
+        page = paginator.page(self.request.GET.get(self.cursor_query_param) or None)
+        return (paginator, page, page.object_list, page.has_other_pages())
@@ -0,0 +1,103 @@
+"""
+Recently viewed entries, kept in a signed cookie instead of the session.
+
+The ids are stored oldest first as zigzag varint deltas (consecutive ids
+are usually close, so most take one or two bytes), base64url-encoded and
+signed with set_signed_cookie(). Recording a view is a Set-Cookie header
+rather than a session-table UPDATE, and concurrent tabs no longer queue
+behind each other's session writes.
+"""
+import base64
+
+from django.conf import settings
+
+
+# Maximum number of recently viewed entries remembered
+MAX_RECENT_ENTRIES = 10
+RECENT_COOKIE_NAME = "recent_entries"
+RECENT_COOKIE_SALT = "myapp.recent"
+# Seconds the history survives without another view
+RECENT_COOKIE_MAX_AGE = 30 * 24 * 60 * 60
+# Where the history lived before the cookie; still read as a fallback
+RECENT_SESSION_KEY = "recent_entries"
+
+
+def encode_ids(ids):
+    """Packs a list of positive ints into a short URL-safe string."""
+    data = bytearray()
+    previous = 0
+    for value in ids:
+        delta = value - previous
+        previous = value
+        zigzag = delta * 2 if delta >= 0 else -delta * 2 - 1
+        while zigzag >= 0x80:
+            data.append(zigzag & 0x7F | 0x80)
+            zigzag >>= 7
+        data.append(zigzag)
+    return base64.urlsafe_b64encode(bytes(data)).rstrip(b"=").decode()
+
+
+def decode_ids(value):
+    """Inverse of encode_ids(); raises ValueError on malformed input."""
+    try:
+        data = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+    except (TypeError, ValueError) as error:
+        raise ValueError("Malformed id list.") from error
+
+    ids = []
+    previous = zigzag = shift = 0
+    for byte in data:
+        zigzag |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        delta = zigzag >> 1 if not zigzag & 1 else -(zigzag >> 1) - 1
+        previous += delta
+        ids.append(previous)
+        zigzag = shift = 0
+    if shift:
+        raise ValueError("Truncated id list.")
+    return ids
+
+
+def get_recent_entries(request):
+    """
+    Ids of the entries `request`'s user viewed most recently, oldest first.
+
+    Reads the signed cookie; visitors from before the cookie existed fall
+    back to the old session list until their next detail view.
+    """
+    value = request.get_signed_cookie(
+        RECENT_COOKIE_NAME,
+        default=None,
+        salt=RECENT_COOKIE_SALT,
+        max_age=RECENT_COOKIE_MAX_AGE,
+    )
+    if value is not None:
+        try:
+            return decode_ids(value)[-MAX_RECENT_ENTRIES:]
+        except ValueError:
+            return []
+    return list(request.session.get(RECENT_SESSION_KEY, []))
+
+
+def remember_entry(request, response, entry_id):
+    """
+    Moves `entry_id` to the end of the history and stores it on `response`.
+    The cookie is set even when the entry already is the most recent one,
+    so every view restarts its max_age.
+    """
+    recent = get_recent_entries(request)
+    if entry_id in recent:
+        recent.remove(entry_id)
+    recent.append(entry_id)
+
+    response.set_signed_cookie(
+        RECENT_COOKIE_NAME,
+        encode_ids(recent[-MAX_RECENT_ENTRIES:]),
+        salt=RECENT_COOKIE_SALT,
+        max_age=RECENT_COOKIE_MAX_AGE,
+        secure=settings.SESSION_COOKIE_SECURE,
+        httponly=True,
+        samesite="Lax",
+    )
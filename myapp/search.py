@@ -0,0 +1,171 @@
+import hashlib
+import threading
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordDistance
+from django.core.cache import cache
+from django.db.models import F
+
+from .models import Entry, SEARCH_CONFIG
+
+
+# Shorter terms produce too few trigrams to use the title index
+AUTOCOMPLETE_MIN_LENGTH = 3
+# Longest term accepted; anything beyond this is truncated
+AUTOCOMPLETE_MAX_LENGTH = 100
+# Seconds a per-prefix result list is served from cache
+AUTOCOMPLETE_CACHE_TIMEOUT = 30
+# Seconds a request waits on an identical lookup already in flight
+AUTOCOMPLETE_WAIT_TIMEOUT = 2
+# Seconds a live-search result list is served from cache
+LIVE_SEARCH_CACHE_TIMEOUT = 30
+
+
+def normalize_term(term):
+    """
+    Lower-cases and collapses whitespace so that "Run", "run " and "run"
+    share one cache entry and one in-flight lookup.
+    """
+    return " ".join(str(term).lower().split())[:AUTOCOMPLETE_MAX_LENGTH]
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one execution.
+
+    The first caller runs the function; callers arriving while it is in
+    flight block until it finishes and share its result. A follower that
+    waits longer than `timeout` runs the function itself rather than
+    stalling the request.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if call.event.wait(self.timeout) and call.error is None:
+                return call.result
+            return fn()
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+
+_autocomplete_flight = SingleFlight(AUTOCOMPLETE_WAIT_TIMEOUT)
+
+
+def _lookup_titles(term, limit):
+    """
+    Returns the `limit` published titles closest to `term` as dicts with
+    'title' and 'public_id'.
+
+    `term %> title` keeps only titles containing a word similar to the
+    (possibly partial) term, and ordering by the `<<->` word distance lets
+    the GiST trigram index return the nearest titles directly (KNN scan)
+    instead of ranking every match.
+    """
+    return list(
+        Entry.published.filter(title__trigram_word_similar=term)
+        .order_by(TrigramWordDistance(term, "title"), "-created_at")
+        .values("title", "public_id")[:limit]
+    )
+
+
+def autocomplete_titles(term, limit):
+    """
+    Title suggestions for a partially typed search term.
+
+    Results are cached per normalized prefix for AUTOCOMPLETE_CACHE_TIMEOUT
+    seconds, and identical prefixes requested concurrently (fast typists,
+    several tabs) share a single database query.
+    """
+    term = normalize_term(term)
+    if len(term) < AUTOCOMPLETE_MIN_LENGTH:
+        return []
+
+    digest = hashlib.md5(term.encode()).hexdigest()
+    key = f"autocomplete:{limit}:{digest}"
+
+    results = cache.get(key)
+    if results is not None:
+        return results
+
+    def compute():
+        # Re-check: the previous leader may have just filled the cache
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        found = _lookup_titles(term, limit)
+        cache.set(key, found, AUTOCOMPLETE_CACHE_TIMEOUT)
+        return found
+
+    return _autocomplete_flight.do(key, compute)
+
+
+def _live_search_key(term, limit):
+    digest = hashlib.md5(term.encode()).hexdigest()
+    return f"live_search:{limit}:{digest}"
+
+
+def _live_search_rows(term, limit):
+    """Full-text matches for `term` as dicts with pk, title and public_id, best first."""
+    query = SearchQuery(term, config=SEARCH_CONFIG)
+    return (
+        Entry.objects.filter(search_vector=query)
+        .annotate(rank=SearchRank(F("search_vector"), query))
+        .order_by("-rank", "-created_at")
+        .values("pk", "title", "public_id")
+        [:limit]
+    )
+
+
+def live_search(term, limit):
+    """
+    The live search's top `limit` matches for `term`, cached per
+    whitespace-normalized term for LIVE_SEARCH_CACHE_TIMEOUT seconds.
+    """
+    term = " ".join(str(term).split())
+    if not term:
+        return []
+    key = _live_search_key(term, limit)
+    rows = cache.get(key)
+    if rows is None:
+        rows = list(_live_search_rows(term, limit))
+        cache.set(key, rows, LIVE_SEARCH_CACHE_TIMEOUT)
+    return rows
+
+
+async def alive_search(term, limit):
+    """live_search() for async views: async ORM and cache calls, same cache entries."""
+    term = " ".join(str(term).split())
+    if not term:
+        return []
+    key = _live_search_key(term, limit)
+    rows = await cache.aget(key)
+    if rows is None:
+        rows = [row async for row in _live_search_rows(term, limit)]
+        await cache.aset(key, rows, LIVE_SEARCH_CACHE_TIMEOUT)
+    return rows
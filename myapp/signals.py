@@ -0,0 +1,288 @@
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db.models import F, PositiveIntegerField, Subquery
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .aggregates import bump_category, bump_totals, invalidate_aggregates
+from .comments import invalidate_comment_tree
+from .membership import invalidate_memberships
+from .pagecache import purge_entries
+from .versions import forget_entry_states, touch_entries
+from .models import Entry, Comment
+
+
+# Entry M2M through tables and the denormalized counter each one feeds
+COUNTER_FIELDS = {
+    Entry.likes.through: "total_likes",
+    Entry.favorites.through: "total_favorites",
+}
+
+
+def adjust_counter(entry_ids, field, delta):
+    """
+    Atomically shifts a denormalized counter on the given entries.
+
+    Uses an F() expression so concurrent writers never overwrite each other,
+    and clamps at zero so a drifted counter cannot violate the column's
+    positive constraint (reconcile_entry_counters fixes the drift later).
+    """
+    if not entry_ids or not delta:
+        return
+    Entry.objects.filter(pk__in=entry_ids).update(**{
+        field: Greatest(F(field) + delta, 0, output_field=PositiveIntegerField())
+    })
+
+
+def _adjust_from_rows(entry_ids, field, sign):
+    """
+    Applies one counter change per through-table row, grouped so that
+    entries losing/gaining the same number of rows share a single UPDATE.
+    """
+    by_delta = {}
+    for entry_id, n in Counter(entry_ids).items():
+        by_delta.setdefault(n, []).append(entry_id)
+    for n, ids in by_delta.items():
+        adjust_counter(ids, field, sign * n)
+
+
+@receiver(m2m_changed, sender=Entry.likes.through)
+@receiver(m2m_changed, sender=Entry.favorites.through)
+def update_membership_counters(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keeps total_likes / total_favorites in step with the M2M tables.
+
+    Works from both sides of the relation (entry.likes.add(user) and
+    user.liked_entries.add(entry)). Removals and clears look up the rows
+    that actually exist beforehand, since Django reports the requested
+    pk_set rather than the rows it deleted.
+    """
+    field = COUNTER_FIELDS[sender]
+
+    if action == "post_add":
+        if reverse:
+            adjust_counter(pk_set, field, 1)
+        else:
+            adjust_counter([instance.pk], field, len(pk_set))
+
+    elif action in ("pre_remove", "pre_clear"):
+        rows = sender.objects.filter(**{"user_id" if reverse else "entry_id": instance.pk})
+        if action == "pre_remove":
+            rows = rows.filter(**{"entry_id__in" if reverse else "user_id__in": pk_set})
+        instance._pending_counter_rows = list(rows.values_list("entry_id", flat=True))
+
+    elif action in ("post_remove", "post_clear"):
+        entry_ids = getattr(instance, "_pending_counter_rows", [])
+        instance._pending_counter_rows = []
+        _adjust_from_rows(entry_ids, field, -1)
+
+
+@receiver(m2m_changed, sender=Entry.likes.through)
+@receiver(m2m_changed, sender=Entry.favorites.through)
+def evict_membership_sets(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Drops the cached like/favourite id sets of every user whose rows
+    changed, marks the affected entries changed for conditional GETs and
+    purges their anonymous cached pages.
+    Clears report no pk_set, so the other side is looked up beforehand.
+    """
+    if action == "pre_clear":
+        column = "entry_id" if reverse else "user_id"
+        instance._cleared_ids = list(
+            sender.objects.filter(**{"user_id" if reverse else "entry_id": instance.pk})
+            .values_list(column, flat=True)
+        )
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    other_ids = pk_set if action != "post_clear" else getattr(instance, "_cleared_ids", [])
+    instance._cleared_ids = []
+    if reverse:
+        invalidate_memberships([instance.pk])
+        touch_entries(other_ids)
+        purge_entries(other_ids)
+    else:
+        invalidate_memberships(other_ids)
+        touch_entries([instance.pk], categories=[instance.category])
+        purge_entries([instance.pk])
+
+
+@receiver(pre_delete, sender=Entry)
+def mark_entry_deletion(sender, instance, origin=None, **kwargs):
+    """
+    Lists the entry on the delete's origin (the entry, queryset or user
+    being deleted), which every signal of that delete receives, so the
+    cascaded comments can tell their entry is going too. Re-reads the
+    comment count release_entry_aggregates gives back, since the instance
+    may have been loaded before the latest comments.
+    """
+    if origin is not None:
+        if not hasattr(origin, "_deleted_entry_ids"):
+            origin._deleted_entry_ids = set()
+        origin._deleted_entry_ids.add(instance.pk)
+    instance.total_comments = (
+        Entry.objects.filter(pk=instance.pk).values_list("total_comments", flat=True).first() or 0
+    )
+
+
+def _deleted_with_entry(instance, origin):
+    """
+    True when a comment is deleted together with its entry: the entry's
+    own handlers then cover the counters, totals and caches once instead
+    of once per comment.
+    """
+    return instance.entry_id in getattr(origin, "_deleted_entry_ids", ())
+
+
+@receiver(post_save, sender=Comment)
+def increment_comment_counter(sender, instance, created, **kwargs):
+    if created:
+        adjust_counter([instance.entry_id], "total_comments", 1)
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_comment_counter(sender, instance, origin=None, **kwargs):
+    """
+    Fires for direct deletes and for every reply removed by the parent
+    CASCADE, so each deleted comment is subtracted exactly once. Comments
+    going with their entry are skipped; the counter goes with the row.
+    """
+    if _deleted_with_entry(instance, origin):
+        return
+    adjust_counter([instance.entry_id], "total_comments", -1)
+
+
+@receiver(pre_delete, sender=get_user_model())
+def release_user_memberships(sender, instance, **kwargs):
+    """
+    Deleting a user cascades through the M2M tables without m2m_changed,
+    so release that user's likes and favourites before the rows vanish.
+    """
+    for through, field in COUNTER_FIELDS.items():
+        Entry.objects.filter(
+            pk__in=Subquery(
+                through.objects.filter(user_id=instance.pk).values("entry_id")
+            )
+        ).update(**{
+            field: Greatest(F(field) - 1, 0, output_field=PositiveIntegerField())
+        })
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def evict_comment_tree(sender, instance, origin=None, **kwargs):
+    if _deleted_with_entry(instance, origin):
+        return
+    invalidate_comment_tree(instance.entry_id)
+    # Comment counts feed the lists and the totals as well
+    touch_entries([instance.entry_id], aggregates=True)
+    purge_entries([instance.entry_id])
+
+
+def _is_only_published_entry(entry):
+    """True if `entry` is (or was) its author's only published entry."""
+    return not (
+        Entry.objects.filter(author_id=entry.author_id, is_published=True)
+        .exclude(pk=entry.pk)
+        .exists()
+    )
+
+
+@receiver(post_save, sender=Entry)
+@receiver(post_delete, sender=Entry)
+def touch_entry_versions(sender, instance, **kwargs):
+    """
+    Marks the entry and its lists changed, and the aggregates too when the
+    entry was created, deleted, moved or (un)published; purges its cached
+    anonymous pages. Connected ahead of
+    update_entry_aggregates, which overwrites _loaded_values.
+    """
+    loaded = getattr(instance, "_loaded_values", None) or {}
+    categories = {instance.category, loaded.get("category", instance.category)}
+    aggregates = (
+        kwargs.get("signal") is post_delete
+        or kwargs.get("created", False)
+        or loaded.get("category") != instance.category
+        or loaded.get("is_published") != instance.is_published
+    )
+    forget_entry_states([instance.public_id])
+    touch_entries([instance.pk], categories=categories, aggregates=aggregates)
+    purge_entries([instance.pk])
+    if kwargs.get("signal") is post_delete:
+        # Its cascaded comments skip evict_comment_tree
+        invalidate_comment_tree(instance.pk)
+
+
+@receiver(post_save, sender=Entry)
+def update_entry_aggregates(sender, instance, created, **kwargs):
+    """
+    Moves the cached category counts and published totals by the
+    difference this save made (creation, category change, publishing
+    or unpublishing).
+    """
+    loaded = getattr(instance, "_loaded_values", None)
+
+    if created:
+        bump_category(instance.category, 1)
+        if instance.is_published:
+            bump_totals(
+                users=1 if _is_only_published_entry(instance) else 0,
+                comments=instance.total_comments,
+                entries=1,
+            )
+    elif loaded is None or not {"category", "is_published"} <= loaded.keys():
+        # Saved without a known previous state: fall back to a recount
+        invalidate_aggregates()
+    else:
+        if loaded["category"] != instance.category:
+            bump_category(loaded["category"], -1)
+            bump_category(instance.category, 1)
+        if loaded["is_published"] != instance.is_published:
+            sign = 1 if instance.is_published else -1
+            bump_totals(
+                users=sign if _is_only_published_entry(instance) else 0,
+                comments=sign * instance.total_comments,
+                entries=sign,
+            )
+
+    instance._loaded_values = {
+        **(loaded or {}),
+        "category": instance.category,
+        "is_published": instance.is_published,
+    }
+
+
+@receiver(post_delete, sender=Entry)
+def release_entry_aggregates(sender, instance, **kwargs):
+    """
+    Cascaded comments skip uncount_comment_in_totals, so the entry's
+    comment count is released here along with the entry and author counts.
+    """
+    bump_category(instance.category, -1)
+    if instance.is_published:
+        bump_totals(
+            users=-1 if _is_only_published_entry(instance) else 0,
+            comments=-instance.total_comments,
+            entries=-1,
+        )
+
+
+def _on_published_entry(comment):
+    if Comment.entry.is_cached(comment):
+        return comment.entry.is_published
+    return Entry.objects.filter(pk=comment.entry_id, is_published=True).exists()
+
+
+@receiver(post_save, sender=Comment)
+def count_comment_in_totals(sender, instance, created, **kwargs):
+    if created and _on_published_entry(instance):
+        bump_totals(comments=1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment_in_totals(sender, instance, origin=None, **kwargs):
+    if not _deleted_with_entry(instance, origin) and _on_published_entry(instance):
+        bump_totals(comments=-1)
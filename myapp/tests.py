@@ -1,3 +1,375 @@
-from django.test import TestCase
+import io
+import json
+import os
+import socket
+import tempfile
+import threading
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from . import fragments, writebehind
+from .aggregates import TOTALS_KEYS, get_totals, reconcile_totals
+from .membership import toggle_membership
+from .recent import RECENT_COOKIE_MAX_AGE, RECENT_COOKIE_NAME, get_recent_entries, remember_entry
+from .writebehind import MembershipBuffer, replay_orphaned_journals
+from .models import Comment, Entry
+
+
+# Per-test-run caches, so counters and versions start from nothing
+TEST_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "myapp-tests"}}
+
+
+def create_entry(author, title="Morning run", is_published=True):
+    return Entry.objects.create(
+        title=title,
+        text="Five kilometres.",
+        category=Entry.Category.values[0],
+        author=author,
+        is_published=is_published,
+    )
+
+
+class ToggleMembershipTests(TransactionTestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("liker", password="pw")
+        self.entry = create_entry(self.user)
+
+    def toggle_concurrently(self, times):
+        """Runs `times` likes of the entry by the user at once, one connection each."""
+        barrier = threading.Barrier(times)
+        results, errors = [], []
+
+        def worker():
+            try:
+                barrier.wait()
+                results.append(toggle_membership("likes", self.user.id, id=self.entry.id))
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(times)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return results
+
+    def test_concurrent_double_toggle_keeps_counter_in_step(self):
+        results = self.toggle_concurrently(2)
+
+        self.entry.refresh_from_db()
+        rows = self.entry.likes.count()
+        self.assertIn(rows, (0, 1))
+        self.assertEqual(self.entry.total_likes, rows)
+        self.assertEqual(sorted(result.active for result in results), [False, True] if rows == 0 else [True, True])
+
+    def test_unpublished_entry_is_not_toggled(self):
+        Entry.objects.filter(pk=self.entry.pk).update(is_published=False)
+
+        self.assertIsNone(toggle_membership("likes", self.user.id, id=self.entry.id))
+        self.assertIsNone(toggle_membership("likes", self.user.id, public_id=self.entry.public_id))
+        self.assertEqual(self.entry.likes.count(), 0)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CounterTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.bob = User.objects.create_user("bob", password="pw")
+        self.entry = create_entry(self.alice)
+        self.other = create_entry(self.bob, title="Evening swim")
+        # Recounts (and caches) the totals the signals then move
+        cache.clear()
+        get_totals()
+
+    def assertCounters(self, entry, likes=0, favorites=0, comments=0):
+        entry.refresh_from_db()
+        self.assertEqual(
+            (entry.total_likes, entry.total_favorites, entry.total_comments),
+            (likes, favorites, comments),
+        )
+
+    def assertTotalsMatchRecount(self):
+        totals = get_totals()
+        recounted = reconcile_totals()
+        self.assertEqual(totals, {name: recounted[key] for name, key in TOTALS_KEYS.items()})
+
+    def comment(self, entry, author, parent=None):
+        return Comment.objects.create(entry=entry, author=author, text="Nice", parent=parent, is_published=True)
+
+    def test_m2m_add_remove_clear_from_the_entry_side(self):
+        self.entry.likes.add(self.alice, self.bob)
+        self.entry.favorites.add(self.bob)
+        self.assertCounters(self.entry, likes=2, favorites=1)
+
+        self.entry.likes.remove(self.bob)
+        # Removing a user who never liked it changes nothing
+        self.entry.favorites.remove(self.alice)
+        self.assertCounters(self.entry, likes=1, favorites=1)
+
+        self.entry.likes.clear()
+        self.entry.favorites.clear()
+        self.assertCounters(self.entry)
+
+    def test_m2m_add_remove_clear_from_the_user_side(self):
+        self.bob.liked_entries.add(self.entry, self.other)
+        self.bob.favorite_entries.add(self.entry)
+        self.assertCounters(self.entry, likes=1, favorites=1)
+        self.assertCounters(self.other, likes=1)
+
+        self.bob.liked_entries.remove(self.entry)
+        self.assertCounters(self.entry, favorites=1)
+        self.assertCounters(self.other, likes=1)
+
+        self.bob.liked_entries.clear()
+        self.bob.favorite_entries.clear()
+        self.assertCounters(self.entry)
+        self.assertCounters(self.other)
+
+    def test_comment_add_and_cascading_delete(self):
+        root = self.comment(self.entry, self.bob)
+        self.comment(self.entry, self.alice, parent=root)
+        self.comment(self.entry, self.bob)
+        self.assertCounters(self.entry, comments=3)
+
+        Comment.objects.get(pk=root.pk).delete()
+        self.assertCounters(self.entry, comments=1)
+        self.assertTotalsMatchRecount()
+
+    def test_entry_delete_releases_its_comments_once(self):
+        # Loaded before the comments exist, so its total_comments is stale
+        entry = Entry.objects.get(pk=self.entry.pk)
+        root = self.comment(self.entry, self.bob)
+        self.comment(self.entry, self.alice, parent=root)
+
+        entry.delete()
+        self.assertTotalsMatchRecount()
+
+    def test_entry_queryset_delete_releases_its_comments_once(self):
+        self.comment(self.entry, self.bob)
+        self.comment(self.other, self.alice)
+
+        Entry.objects.filter(pk__in=[self.entry.pk, self.other.pk]).delete()
+        self.assertTotalsMatchRecount()
+
+    def test_user_delete_cascades_through_entries_comments_and_memberships(self):
+        root = self.comment(self.entry, self.bob)
+        self.comment(self.entry, self.alice, parent=root)
+        self.comment(self.other, self.alice)
+        self.comment(self.other, self.bob)
+        self.other.likes.add(self.alice, self.bob)
+        self.other.favorites.add(self.alice)
+
+        get_user_model().objects.get(pk=self.alice.pk).delete()
+
+        self.assertFalse(Entry.objects.filter(pk=self.entry.pk).exists())
+        self.assertCounters(self.other, likes=1, comments=1)
+        self.assertTotalsMatchRecount()
+
+    def test_reconcile_command_fixes_drifted_counters(self):
+        self.entry.likes.add(self.bob)
+        self.comment(self.entry, self.bob)
+        Entry.objects.filter(pk=self.entry.pk).update(total_likes=7, total_comments=0, total_favorites=3)
+
+        out = io.StringIO()
+        call_command("reconcile_entry_counters", stdout=out)
+
+        self.assertIn("Reconciled 1 drifted entries.", out.getvalue())
+        self.assertCounters(self.entry, likes=1, comments=1)
+        self.assertCounters(self.other)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FragmentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = get_user_model().objects.create_user("writer", password="pw")
+        self.entry = create_entry(self.author)
+        patcher = mock.patch.object(fragments, "render_to_string", wraps=fragments.render_to_string)
+        self.render = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def card(self):
+        """The entry's card as a fresh list request would output it."""
+        entry = Entry.published.get(pk=self.entry.pk)
+        fragments.render_cards([entry])
+        return str(entry.card_html)
+
+    def test_nothing_is_rendered_unless_output(self):
+        entry = Entry.published.get(pk=self.entry.pk)
+        fragments.render_cards([entry])
+        fragments.render_body(entry)
+        self.assertEqual(self.render.call_count, 0)
+
+    def test_card_is_reused_until_the_entry_changes(self):
+        first = self.card()
+        self.assertIn("Morning run", first)
+        self.assertEqual(self.card(), first)
+        self.assertEqual(self.render.call_count, 1)
+
+        self.entry.likes.add(self.author)
+        self.assertIn("1 like", self.card())
+        self.assertEqual(self.render.call_count, 2)
+
+    def test_card_is_rerendered_after_the_author_is_renamed(self):
+        self.card()
+        self.author.username = "renamed"
+        self.author.save()
+
+        self.assertIn("renamed", self.card())
+        self.assertEqual(self.render.call_count, 2)
+
+    def test_body_is_reused_until_the_entry_is_edited(self):
+        entry = Entry.published.get(pk=self.entry.pk)
+        self.assertIn("Five kilometres.", str(fragments.render_body(entry)))
+        str(fragments.render_body(Entry.published.get(pk=self.entry.pk)))
+        self.assertEqual(self.render.call_count, 1)
+
+        entry.text = "Ten kilometres."
+        entry.save()
+        self.assertIn("Ten kilometres.", str(fragments.render_body(Entry.published.get(pk=self.entry.pk))))
+        self.assertEqual(self.render.call_count, 2)
+
+
+class RecentEntriesTests(SimpleTestCase):
+    def view(self, entry_id, cookies=None):
+        """Records a view of `entry_id`; returns the response's history cookie."""
+        request = RequestFactory().get("/")
+        request.COOKIES.update(cookies or {})
+        request.session = {}
+        response = HttpResponse()
+        remember_entry(request, response, entry_id)
+        return response.cookies
+
+    def test_views_move_entries_to_the_end(self):
+        cookies = self.view(3)
+        cookies = self.view(5, {RECENT_COOKIE_NAME: cookies[RECENT_COOKIE_NAME].value})
+        cookies = self.view(3, {RECENT_COOKIE_NAME: cookies[RECENT_COOKIE_NAME].value})
+
+        request = RequestFactory().get("/")
+        request.COOKIES[RECENT_COOKIE_NAME] = cookies[RECENT_COOKIE_NAME].value
+        self.assertEqual(get_recent_entries(request), [5, 3])
+
+    def test_viewing_the_most_recent_entry_again_refreshes_the_cookie(self):
+        cookies = self.view(3)
+        cookies = self.view(3, {RECENT_COOKIE_NAME: cookies[RECENT_COOKIE_NAME].value})
+        self.assertEqual(cookies[RECENT_COOKIE_NAME]["max-age"], RECENT_COOKIE_MAX_AGE)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class WriteBehindTests(TestCase):
+    # Above any pid_max, so never a live process
+    DEAD_PID = 99999999
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.bob = User.objects.create_user("bob", password="pw")
+        self.entry = create_entry(self.alice)
+        journal_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(journal_dir.cleanup)
+        self.journal_dir = Path(journal_dir.name)
+
+    def buffer(self):
+        buffer = MembershipBuffer(60, 1000, journal_dir=self.journal_dir)
+        self.addCleanup(lambda: buffer._journal.close())
+        return buffer
+
+    def like(self, buffer, user):
+        return buffer.toggle("likes", user.id, id=self.entry.id)
+
+    def write_journal(self, name, changes):
+        with open(self.journal_dir / name, "w", encoding="utf-8") as journal:
+            for change in changes:
+                journal.write(json.dumps(change) + "\n")
+            # A line torn by the crash
+            journal.write('["likes", ')
+
+    def assertLikes(self, *users):
+        self.entry.refresh_from_db()
+        self.assertEqual(set(self.entry.likes.all()), set(users))
+        self.assertEqual(self.entry.total_likes, len(users))
+
+    def test_flush_writes_the_last_state_per_user(self):
+        buffer = self.buffer()
+        self.like(buffer, self.alice)
+        self.like(buffer, self.alice)
+        self.assertEqual(self.like(buffer, self.bob).count, 1)
+        self.assertLikes()
+
+        self.assertEqual(buffer.flush(), 1)
+        self.assertLikes(self.bob)
+        self.assertEqual(self.like(buffer, self.alice).count, 2)
+        # Only the live journal is left, holding the unflushed change
+        self.assertEqual([path.name for path in self.journal_dir.iterdir()], [buffer._journal_path().name])
+
+    def test_count_is_right_when_a_flush_commits_mid_toggle(self):
+        buffer = self.buffer()
+        self.like(buffer, self.alice)
+        through = Entry.likes.through
+        exists = through.objects.filter
+        flushed = []
+
+        def flush_then_filter(*args, **kwargs):
+            # Alice's like commits after Bob's toggle read the counter
+            if not flushed:
+                flushed.append(buffer.flush())
+            return exists(*args, **kwargs)
+
+        with mock.patch.object(through.objects, "filter", side_effect=flush_then_filter):
+            self.assertEqual(self.like(buffer, self.bob).count, 2)
+        buffer.flush()
+        self.assertLikes(self.alice, self.bob)
+
+    def test_orphaned_journals_of_this_host_are_replayed(self):
+        self.entry.likes.add(self.alice)
+        with mock.patch.object(socket, "gethostname", return_value="web"):
+            # The batch being flushed at the crash, then the newer changes
+            self.write_journal(f"web@{self.DEAD_PID}-3.journal.flushing", [
+                ["likes", self.entry.id, self.bob.id, True],
+                ["likes", self.entry.id, self.alice.id, False],
+            ])
+            self.write_journal(f"web@{self.DEAD_PID}.journal", [
+                ["likes", self.entry.id, self.alice.id, True],
+            ])
+            # Another host whose name starts with this one's
+            self.write_journal(f"web-2@{self.DEAD_PID}.journal", [
+                ["likes", self.entry.id, self.bob.id, False],
+            ])
+
+            self.assertEqual(replay_orphaned_journals(self.journal_dir), 3)
+
+        self.assertLikes(self.alice, self.bob)
+        self.assertEqual([path.name for path in self.journal_dir.iterdir()], [f"web-2@{self.DEAD_PID}.journal"])
+
+    def test_journals_of_live_processes_are_left_alone(self):
+        with mock.patch.object(writebehind, "_pid_alive", return_value=True):
+            self.write_journal(f"{socket.gethostname()}@{self.DEAD_PID}.journal", [
+                ["likes", self.entry.id, self.bob.id, True],
+            ])
+            self.assertEqual(replay_orphaned_journals(self.journal_dir), 0)
+        self.assertLikes()
+
+    def test_changes_of_a_crashed_buffer_are_replayed_by_the_next(self):
+        crashed = self.buffer()
+        self.like(crashed, self.alice)
+        self.like(crashed, self.bob)
+        self.like(crashed, self.bob)
+        # Dies before flushing: the journal is all that is left
+        crashed._journal.close()
+
+        buffer = MembershipBuffer(60, 1000, journal_dir=self.journal_dir)
+        buffer._journal.close()
+        self.assertLikes(self.alice)
+        self.assertFalse(buffer._pending)
@@ -0,0 +1,93 @@
+"""
+Row format shared by the entry import/export commands and the export view.
+
+One row per entry, keyed by EXPORT_FIELDS, as JSON Lines or CSV. Entries
+are identified by public_id and authors by username, so a file moves
+between installations regardless of their primary keys.
+"""
+import csv
+import io
+import json
+
+from django.utils.dateparse import parse_datetime
+
+from .utils import json_dumps
+
+
+EXPORT_FIELDS = ("public_id", "title", "category", "author", "is_published", "created_at", "text")
+FORMATS = ("jsonl", "csv")
+
+# values_list() lookups producing EXPORT_FIELDS, in order
+_EXPORT_LOOKUPS = ("public_id", "title", "category", "author__username", "is_published", "created_at", "text")
+
+
+def detect_format(path, default="jsonl"):
+    """Format implied by a file name's extension."""
+    if path.endswith(".csv"):
+        return "csv"
+    if path.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return default
+
+
+def export_rows(queryset, chunk_size=2000):
+    """
+    Yields one dict per entry in `queryset`, streamed from a server-side
+    cursor `chunk_size` rows at a time.
+    """
+    rows = queryset.order_by("id").values_list(*_EXPORT_LOOKUPS).iterator(chunk_size=chunk_size)
+    for row in rows:
+        yield dict(zip(EXPORT_FIELDS, row))
+
+
+def encode_jsonl(row):
+    return json_dumps(row) + b"\n"
+
+
+class CSVEncoder:
+    """Encodes rows to CSV lines one at a time; header() comes first."""
+
+    def __init__(self):
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def _line(self, values):
+        self._writer.writerow(values)
+        line = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return line.encode()
+
+    def header(self):
+        return self._line(EXPORT_FIELDS)
+
+    def encode(self, row):
+        return self._line([
+            row[field].isoformat() if field == "created_at" else row[field]
+            for field in EXPORT_FIELDS
+        ])
+
+
+def read_rows(stream, fmt):
+    """
+    Yields (line_number, row dict) from a text stream without loading it.
+    Values are normalized: is_published to bool, created_at to an aware
+    datetime or None.
+    """
+    if fmt == "csv":
+        rows = enumerate(csv.DictReader(stream), start=2)
+    else:
+        rows = (
+            (number, json.loads(line))
+            for number, line in enumerate(stream, start=1)
+            if line.strip()
+        )
+
+    for number, row in rows:
+        published = row.get("is_published", False)
+        if isinstance(published, str):
+            published = published.strip().lower() in ("1", "true", "yes")
+        row["is_published"] = bool(published)
+        created_at = row.get("created_at")
+        row["created_at"] = parse_datetime(created_at) if created_at else None
+        yield number, row
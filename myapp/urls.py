@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -6,8 +7,16 @@ app_name = 'myapp'
 urlpatterns = [
     path('', views.EntryListView.as_view(), name='entry-list'),
     path('search/', views.EntrySearchView.as_view(), name='entry-search'),
+    # Live search on its own URL, so it can be served by an async view
+    path('search/live/', (
+        views.LiveSearchAsyncView if settings.ASYNC_AJAX_VIEWS else views.EntrySearchView
+    ).as_view(), name='entry-live-search'),
+    path('search/autocomplete/', views.EntryAutocompleteView.as_view(), name='entry-autocomplete'),
     path('entry/<uuid:public_id>/', views.EntryDetailView.as_view(), name='entry-detail'),
-    path('addcomment/', views.CommentAjaxView.as_view(), name='addcomment'),
+    path('addcomment/', (
+        views.CommentAjaxAsyncView if settings.ASYNC_AJAX_VIEWS else views.CommentAjaxView
+    ).as_view(), name='addcomment'),
+    path('comments/<uuid:public_id>/', views.CommentThreadsView.as_view(), name='comment-threads'),
     path('entry/new/', views.EntryCreateView.as_view(), name='entry-create'),
     path('entry/edit/<uuid:public_id>/', views.EntryUpdateView.as_view(), name='entry-update'),
     path('entry/delete/<uuid:public_id>/', views.EntryDeleteView.as_view(), name='entry-delete'),
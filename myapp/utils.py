@@ -0,0 +1,51 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+
+try:
+    import orjson
+except ImportError:  # Optional speed-up; the stdlib encoder is used otherwise
+    orjson = None
+
+
+def json_dumps(data):
+    """
+    Encodes `data` to compact JSON bytes.
+
+    Uses orjson when it is installed (several times faster and handles
+    UUID/datetime natively), falling back to json + DjangoJSONEncoder.
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+
+
+def fast_json_response(data, status=200):
+    """
+    JSON response encoded once with json_dumps; unlike JsonResponse it
+    accepts top-level lists without safe=False.
+    """
+    return HttpResponse(json_dumps(data), content_type="application/json", status=status)
+
+
+class AsyncLoginRequiredMixin:
+    """
+    LoginRequiredMixin for views with async handlers.
+
+    Resolves the user with request.auser(), since reading request.user
+    would hit the session and user tables synchronously, and replaces
+    request.user with the result so handlers can use it directly.
+    Unauthenticated requests get handle_no_permission(), a 401 JSON
+    response by default (these views serve AJAX calls, not pages).
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return self.handle_no_permission()
+        request.user = user
+        return await super().dispatch(request, *args, **kwargs)
+
+    def handle_no_permission(self):
+        return JsonResponse({"error": "Authentication required."}, status=401)
@@ -0,0 +1,152 @@
+"""
+Change versions behind the conditional GET support of the entry views.
+
+Each version is the time (in ns) of the last change to what it covers,
+stored in the shared cache so every process sees a bump at once:
+
+  - entry_version:<id>   the entry, its comments, likes and favourites
+  - list_version:all     anything shown on the new/old/popular lists
+  - list_version:<code>  anything shown on one category's list
+  - aggregates_version   the sidebar category counts and totals
+
+Signals and the toggle paths bump them; the views turn them into ETag and
+Last-Modified validators with one or two cache reads, so an unchanged
+page is answered with 304 before any comment, aggregate or template work.
+A missing version counts as "changed now", which is always safe.
+"""
+import hashlib
+import time
+
+from daybook.cache import shared_cache
+
+from .models import Entry
+
+
+# Seconds an entry's (id, updated_at) stays cached for the detail ETag
+ENTRY_STATE_TIMEOUT = 60 * 60
+
+AGGREGATES_VERSION_KEY = "aggregates_version"
+ALL_ENTRIES_SCOPE = "all"
+
+
+def entry_version_key(entry_id):
+    return f"entry_version:{entry_id}"
+
+
+def list_version_key(scope):
+    return f"list_version:{scope}"
+
+
+def entry_state_key(public_id):
+    return f"entry_state:{public_id}"
+
+
+def get_versions(keys):
+    """Returns {key: version}, starting any missing version at now."""
+    cache = shared_cache()
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        now = time.time_ns()
+        for key in missing:
+            cache.add(key, now, None)
+        versions.update(cache.get_many(missing))
+    return versions
+
+
+def bump_versions(keys):
+    if keys:
+        shared_cache().set_many(dict.fromkeys(keys, time.time_ns()), None)
+
+
+def touch_entries(entry_ids, categories=None, aggregates=False):
+    """
+    Marks entries as changed, together with the lists that show them.
+    `categories` are looked up when not given.
+    """
+    entry_ids = [entry_id for entry_id in entry_ids if entry_id is not None]
+    if not entry_ids:
+        return
+    if categories is None:
+        categories = set(
+            Entry.objects.filter(pk__in=entry_ids).values_list("category", flat=True).distinct()
+        )
+    keys = [entry_version_key(entry_id) for entry_id in entry_ids]
+    keys += [list_version_key(scope) for scope in {ALL_ENTRIES_SCOPE, *categories}]
+    if aggregates:
+        keys.append(AGGREGATES_VERSION_KEY)
+    bump_versions(keys)
+
+
+def touch_all_lists():
+    """For bulk writes: every list and the aggregates changed."""
+    bump_versions(
+        [list_version_key(scope) for scope in (ALL_ENTRIES_SCOPE, *Entry.Category.values)]
+        + [AGGREGATES_VERSION_KEY]
+    )
+
+
+def forget_entry_states(public_ids):
+    shared_cache().delete_many([entry_state_key(public_id) for public_id in public_ids])
+
+
+def _entry_state(public_id):
+    """(id, updated_at in ns) of a published entry, or None."""
+    cache = shared_cache()
+    key = entry_state_key(public_id)
+    state = cache.get(key)
+    if state is None:
+        row = Entry.published.filter(public_id=public_id).values_list("id", "updated_at").first()
+        if row is None:
+            return None
+        state = (row[0], int(row[1].timestamp() * 1e9))
+        cache.set(key, state, ENTRY_STATE_TIMEOUT)
+    return state
+
+
+def _validators(parts, changed_at):
+    etag = f'"{hashlib.md5(":".join(map(str, parts)).encode()).hexdigest()}"'
+    return etag, changed_at // 10**9
+
+
+def detail_validators(public_id, user):
+    """
+    Returns (entry_id, etag, last_modified) for an entry's detail page, or
+    None when no published entry matches. The user is part of the ETag
+    because the page shows their favourite/like state.
+    """
+    state = _entry_state(public_id)
+    if state is None:
+        return None
+    entry_id, updated_at = state
+    version = get_versions([entry_version_key(entry_id)])[entry_version_key(entry_id)]
+    etag, last_modified = _validators(
+        [entry_id, updated_at, version, user.pk], max(updated_at, version)
+    )
+    return entry_id, etag, last_modified
+
+
+def entry_page_version(public_id):
+    """
+    Version of everything an entry's anonymous page shows, for the page
+    cache key, or None when no published entry matches.
+    """
+    state = _entry_state(public_id)
+    if state is None:
+        return None
+    entry_id, updated_at = state
+    version = get_versions([entry_version_key(entry_id)])[entry_version_key(entry_id)]
+    return f"{entry_id}:{updated_at}:{version}"
+
+
+def list_validators(request, scope):
+    """
+    Returns (etag, last_modified) for a list page showing `scope` ('all'
+    or a category code), keyed by the full path so each sort, page and
+    cursor validates separately.
+    """
+    versions = get_versions([list_version_key(scope), AGGREGATES_VERSION_KEY])
+    return _validators(
+        [request.get_full_path(), request.user.pk, *sorted(versions.items())],
+        max(versions.values()),
+    )
@@ -1,43 +1,119 @@
 from django.http import JsonResponse
-from django.shortcuts import render
-from .models import Entry, Comment
+from django.shortcuts import get_object_or_404, render
+from .models import Entry, Comment, SEARCH_CONFIG
 from .forms import EntryForm, CommentForm, EntrySearchForm
+from .fragments import forget_fragments, render_body, render_cards
+from .aggregates import get_categories, get_totals
+from .comments import get_comment_tree, thread_page, reply_page, serialize_comment
+from .membership import get_memberships
+from .pagecache import AnonymousPageCacheMixin, entry_surrogate_key
+from .pagination import CursorPaginationMixin
+from .recent import remember_entry
+from .search import alive_search, autocomplete_titles, live_search
+from .utils import AsyncLoginRequiredMixin, fast_json_response, json_dumps
+from .versions import ALL_ENTRIES_SCOPE, detail_validators, entry_page_version, list_validators
 from django.views.generic import ListView, DetailView, CreateView, UpdateView \
     , DeleteView, View, TemplateView
 from django.urls import reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.db.models import Count
-from django.core.cache import cache
-from django.core import serializers
+from django.db.models import F
 from django.views import View
 from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import login_required
-from django.contrib.postgres.search import SearchVector, SearchQuery
+from django.contrib.postgres.search import SearchQuery, SearchRank
 from django.contrib import messages
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
 import logging
 
 
-# Maximum number of recently viewed entries to keep in session
-MAX_RECENT_ENTRIES = 10
 # Maximum number of results returned by the live AJAX search
 AJAX_RESULTS_LIMIT = 3
+# Live search response formats: 1 = legacy double-encoded, 2 = flat array
+LIVE_SEARCH_FORMATS = ("1", "2")
 
 logger = logging.getLogger("daybook")
 
 
-class EntryListView(LoginRequiredMixin, ListView):
+def live_search_response(rows, version):
+    """
+    Encodes live-search rows (dicts with pk, title and public_id) in the
+    requested response format (see LIVE_SEARCH_FORMATS).
+    """
+    if version == "2":
+        return fast_json_response([
+            {"title": row["title"], "public_id": row["public_id"]} for row in rows
+        ])
+
+    # Same structure serializers.serialize("json", ...) produced
+    legacy = [
+        {
+            "model": "myapp.entry",
+            "pk": row["pk"],
+            "fields": {"public_id": row["public_id"], "title": row["title"]},
+        }
+        for row in rows
+    ]
+    return JsonResponse({"search_string": json_dumps(legacy).decode()})
+
+
+def conditional_response(request, etag, last_modified):
+    """
+    Returns a 304 response if the request's validators still match, else
+    None. Requests with flash messages waiting are always answered in
+    full, so a cached page never hides them.
+    """
+    if len(messages.get_messages(request)):
+        return None
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def set_validators(response, etag, last_modified):
+    """
+    Adds the validators to a full response. The pages are per-user, so
+    shared caches must not store them and browsers must revalidate.
+    """
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ["Cookie"])
+    return response
+
+
+class EntryListView(LoginRequiredMixin, CursorPaginationMixin, ListView):
     """
     Displays a paginated, filterable list of journal entries.
     Supports sorting by recency (new/old), popularity, and category filters.
     Category counts and aggregate totals are cached to reduce database load.
     URL query params:
         sort (str): 'new' (default) | 'old' | 'popular' | <Category value>
+        page (int): OFFSET page number (default pagination mode)
+        cursor (str): opaque keyset cursor; pass it (even empty) to opt in to
+                      cursor pagination, which seeks on (created_at, id) or
+                      (total_likes, total_comments, id) and never counts rows
+    Responses carry ETag/Last-Modified validators derived from cached list
+    versions (see myapp.versions); a revalidation of an unchanged page is
+    answered with 304 before any entry, aggregate or template work.
     """
     model = Entry
     template_name = "base/base.html"
     context_object_name = "entries"
     ordering = ["-created_at"]
     paginate_by = 5
+
+    def get(self, request, *args, **kwargs):
+        """
+        Handles GET requests conditionally. A category sort only depends on
+        that category's entries; every other sort on all of them.
+        """
+        sort = request.GET.get("sort", "new")
+        scope = sort if sort in Entry.Category.values else ALL_ENTRIES_SCOPE
+        etag, last_modified = list_validators(request, scope)
+
+        response = conditional_response(request, etag, last_modified)
+        if response is None:
+            response = set_validators(super().get(request, *args, **kwargs), etag, last_modified)
+        return response
  
     def get_queryset(self):
         """
@@ -70,45 +146,46 @@ class EntryListView(LoginRequiredMixin, ListView):
           - 'categories': list of dicts with label, value, and entry count per category
           - 'totals': aggregate counts of published entries, authors, and comments
           - 'current_sort': echoes the active sort param back to the template for UI state
-        Both 'categories' and 'totals' are cached to avoid repeated aggregation queries.
-        Cache TTLs: categories = 15 min, totals = 5 min.
+          - 'liked_ids' / 'favorited_ids': ids of the entries on this page the
+            current user has liked / favourited (one cache read, see
+            myapp.membership.get_memberships)
+          - each entry's 'card_html': its rendered card, from the fragment
+            cache (see myapp.fragments) and only loaded if the template
+            outputs it; the template adds the per-user like/favourite
+            state around it
+        Categories and totals are read from incrementally maintained cache
+        counters (see myapp.aggregates): entry and comment signals keep them
+        current, and the full aggregate queries only run for periodic
+        reconciliation.
         """
         context = super().get_context_data(**kwargs)
         context["current_sort"] = self.request.GET.get("sort", "new")
+        context["categories"] = get_categories()
+        context["totals"] = get_totals()
 
-        context["categories"] = cache.get_or_set(
-            "categories_list",
-            lambda: [
-                {
-                    "label": Entry.Category(row["category"]).label,
-                    "count": row["count"],
-                    "name": Entry.Category(row["category"]).value,
-                }
-                for row in Entry.objects.values("category").annotate(count=Count("id"))
-            ],
-            timeout=60 * 15,
-        )
- 
-        context["totals"] = cache.get_or_set(
-            "entry_totals",
-            lambda: Entry.objects.filter(is_published=True).aggregate(
-                total_users=Count("author", distinct=True),
-                total_comments=Count("comments", distinct=True),
-                total_entries=Count("id", distinct=True),
-            ),
-            timeout=60 * 5,
+        render_cards(context["object_list"])
+        memberships = get_memberships(
+            self.request.user, [entry.id for entry in context["object_list"]]
         )
+        context["liked_ids"] = memberships.liked
+        context["favorited_ids"] = memberships.favorited
  
         return context
 
 
-class EntryDetailView(DetailView):
+class EntryDetailView(AnonymousPageCacheMixin, DetailView):
     """
     Displays a single journal entry by its public_id slug.
 
-    Tracks recently viewed entries in the user's session (capped at
-    MAX_RECENT_ENTRIES). Provides all comments, a comment form, and
-    the authenticated user's favourite status for the entry.
+    Tracks recently viewed entries in a signed cookie (capped at
+    MAX_RECENT_ENTRIES, see myapp.recent). Provides all comments, a
+    comment form, and the authenticated user's favourite status for the
+    entry.
+
+    Anonymous visitors are served from the full-page cache (see
+    myapp.pagecache), keyed on the sort/page params and the entry's change
+    version, and purged through the entry's surrogate key when it, its
+    comments or its likes change.
 
     URL kwargs:
         public_id (str): the entry's public_id field used as the slug.
@@ -119,54 +196,71 @@ class EntryDetailView(DetailView):
     template_name = "myapp/entry_detail.html"
     slug_field = "public_id"        # Look up Entry by this model field
     slug_url_kwarg = "public_id"    # Matched from the URL pattern
+    page_cache_params = ("sort", "page")
 
+    def get_page_version(self):
+        return entry_page_version(self.kwargs[self.slug_url_kwarg])
 
-    def get_queryset(self):
-        return super().get_queryset().prefetch_related("favorites")
+    def get_surrogate_keys(self):
+        return [entry_surrogate_key(self.object.id)]
 
     def get(self, request, *args, **kwargs):
         """
-        Handles GET requests and maintains a capped, ordered list of recently
-        viewed entry IDs in the session (most recent last).
+        Handles GET requests and records the entry as most recently viewed
+        in the 'recent_entries' cookie. The session is never written, so a
+        page view costs no session-table UPDATE.
 
-        Session key: 'recent_entries' — list of int entry IDs, max MAX_RECENT_ENTRIES.
+        The ETag/Last-Modified validators come from the entry's cached
+        version (see myapp.versions.detail_validators), so revalidating an
+        unchanged entry returns 304 without loading it, its comments or its
+        membership state.
         """
-        response = super().get(request, *args, **kwargs)
-        entry_id = self.object.id
         logger.info(f"Requesting post id={kwargs.get('public_id')}")
-
-        recent = request.session.get("recent_entries", [])
-
-        # Move entry to end (most recent) regardless of prior position
-        if entry_id in recent:
-            recent.remove(entry_id)
-        recent.append(entry_id)
-
-        request.session["recent_entries"] = recent[-MAX_RECENT_ENTRIES:]
-        request.session.modified = True
-
+        validators = detail_validators(kwargs.get(self.slug_url_kwarg), request.user)
+        if validators is None:
+            # Not published (or no such entry): let get_object() raise 404
+            return super().get(request, *args, **kwargs)
+
+        entry_id, etag, last_modified = validators
+        response = conditional_response(request, etag, last_modified)
+        if response is None:
+            response = set_validators(super().get(request, *args, **kwargs), etag, last_modified)
+        # The history is only shown to signed-in users; leaving anonymous
+        # responses cookie-free keeps them cacheable
+        if request.user.is_authenticated:
+            remember_entry(request, response, entry_id)
         return response
 
     def get_context_data(self, **kwargs):
         """
         Extends context with:
-          - 'allcomments': threaded comments for this entry, with authors preloaded
+          - 'allcomments': published comments in (tree_id, lft) order, authors
+            preloaded — ready for {% recursetree %} without extra queries
+          - 'comment_tree': the same comments as nested root nodes
+            (node.get_children() is served from memory)
+          - 'comment_threads_cursor': cursor for the next page of threads
+            from CommentThreadsView, or None if all threads are shown
           - 'comment_form': blank CommentForm for posting a new comment
           - 'fav': True if the current authenticated user has favourited this entry
+          - 'liked': True if the current authenticated user has liked this entry
+          - 'entry_body': the entry's rendered title, meta and text, from the
+            fragment cache (see myapp.fragments) and only loaded if the
+            template outputs it
         """
         context = super().get_context_data(**kwargs)
 
-        # Fetch comments with author data in one query; order for threaded display
-        context["allcomments"] = (
-            Comment.objects.filter(entry=self.object)
-            .select_related("author")
-            .order_by("parent_id", "created_at")  
-        )
+        # First page of threads only, built in linear time and cached per
+        # entry; the rest is fetched lazily (see myapp.comments)
+        (
+            context["comment_tree"],
+            context["allcomments"],
+            context["comment_threads_cursor"],
+        ) = get_comment_tree(self.object)
 
-        context["fav"] = (
-            self.request.user.is_authenticated
-            and self.object.favorites.filter(id=self.request.user.id).exists()
-        )
+        memberships = get_memberships(self.request.user, [self.object.id])
+        context["fav"] = self.object.id in memberships.favorited
+        context["liked"] = self.object.id in memberships.liked
+        context["entry_body"] = render_body(self.object)
 
         # Blank form for authenticated users to submit a new comment
         context["comment_form"] = CommentForm()
@@ -238,7 +332,8 @@ class CommentAjaxView(View):
             comment = Comment(
                 text=text,
                 author=request.user,
-                entry=entry
+                entry=entry,
+                is_published=True,
             )
             
             # If there's a parent, set it
@@ -270,6 +365,144 @@ class CommentAjaxView(View):
             }, status=500)
 
 
+class CommentAjaxAsyncView(AsyncLoginRequiredMixin, View):
+    """
+    Async-native twin of CommentAjaxView: same POST params and JSON
+    responses, with lookups through the async ORM (aget/aexists) so the
+    worker is free while Postgres answers. Saving and deleting go through
+    asave()/adelete(), which run the MPTT bookkeeping and signal receivers
+    in a thread. Served instead of the sync view when
+    settings.ASYNC_AJAX_VIEWS is on; only useful under ASGI.
+
+    Unauthenticated requests get a 401 JSON response instead of a redirect.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        if not request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({
+                'error': 'This endpoint only accepts AJAX requests'
+            }, status=400)
+
+        if request.POST.get('action') == 'delete':
+            return await self.delete_comment(request)
+        return await self.add_comment(request)
+
+    async def delete_comment(self, request):
+        """Handle comment deletion"""
+        comment_id = request.POST.get('nodeid')
+
+        try:
+            comment = await Comment.objects.aget(id=comment_id)
+        except (Comment.DoesNotExist, ValueError):
+            return JsonResponse({
+                'error': 'Comment not found'
+            }, status=404)
+
+        # Compare ids: comment.author would be a synchronous query
+        if comment.author_id != request.user.pk:
+            return JsonResponse({
+                'error': 'You do not have permission to delete this comment'
+            }, status=403)
+
+        await comment.adelete()
+        return JsonResponse({'remove': comment_id})
+
+    async def add_comment(self, request):
+        """Handle new comment submission"""
+        text = request.POST.get('text')
+        entry_id = request.POST.get('entry')
+        parent_id = request.POST.get('parent')
+
+        if not text or not entry_id:
+            return JsonResponse({
+                'error': 'Missing required fields',
+                'details': 'Content and entry ID are required'
+            }, status=400)
+
+        try:
+            if not await Entry.objects.filter(id=entry_id).aexists():
+                return JsonResponse({
+                    'error': 'Entry not found'
+                }, status=404)
+
+            comment = Comment(
+                text=text,
+                author=request.user,
+                entry_id=entry_id,
+                is_published=True,
+            )
+
+            if parent_id:
+                try:
+                    comment.parent = await Comment.objects.aget(id=parent_id)
+                except Comment.DoesNotExist:
+                    return JsonResponse({
+                        'error': 'Parent comment not found'
+                    }, status=404)
+
+            await comment.asave()
+
+            return JsonResponse({
+                'result': text,
+                'user': request.user.username,
+                'id': comment.id
+            })
+
+        except Exception as e:
+            return JsonResponse({
+                'error': 'An error occurred while saving the comment',
+                'details': str(e)
+            }, status=500)
+
+
+class CommentThreadsView(View):
+    """
+    Lazily loads an entry's comment threads as JSON.
+
+    Two modes, both paged by opaque keyset cursors:
+      1. Threads (no 'node' param): the next COMMENT_THREADS_PAGE_SIZE
+         top-level comments, oldest first, with their replies.
+      2. Replies ('node' param): the next COMMENT_REPLIES_PAGE_SIZE direct
+         replies to that comment, with their replies ("load more replies").
+
+    Small subtrees are inlined; comments with many replies come back with
+    'replies_deferred': true and are expanded through mode 2.
+
+    URL kwargs:
+        public_id (str): the entry's public_id.
+    URL query params:
+        cursor (str): value of 'next_cursor' from the previous page.
+        node (int): id of the comment whose replies to load.
+
+    Returns:
+        JsonResponse: {'comments': [...], 'next_cursor': str | None}
+    """
+
+    def get(self, request, *args, **kwargs):
+        # Drafts have no public threads; the manager's author join is not needed
+        entry = get_object_or_404(
+            Entry.published.select_related(None).only("id"), public_id=kwargs["public_id"]
+        )
+        cursor = request.GET.get("cursor") or None
+        node_id = request.GET.get("node")
+
+        if node_id:
+            if not node_id.isdigit():
+                return JsonResponse({"error": "Invalid comment ID."}, status=400)
+            node = get_object_or_404(
+                Comment.objects.only("id"),
+                id=int(node_id), entry_id=entry.id, is_published=True,
+            )
+            page = reply_page(entry.id, node, cursor)
+        else:
+            page = thread_page(entry.id, cursor)
+
+        return JsonResponse({
+            "comments": [serialize_comment(comment) for comment in page],
+            "next_cursor": page.next_cursor,
+        })
+
+
 class EntryCreateView(LoginRequiredMixin, CreateView):
     """
     Allows authenticated users to create a new journal entry.
@@ -343,8 +576,10 @@ class EntryUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
 
     def form_valid(self, form):
         """
-        Ensures the author field cannot be overwritten on update.
+        Ensures the author field cannot be overwritten on update, and drops
+        the entry's cached fragments (keyed by the updated_at being replaced).
         """
+        forget_fragments(self.object)
         form.instance.author = self.request.user
         logger.info(f"Updating post id={self.object.id}")
         messages.success(self.request, "Entry updated successfully.")
@@ -398,8 +633,10 @@ class EntryDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     def form_valid(self, form):
         """
         Hook called on confirmed DELETE (POST to the confirm page).
+        Drops the entry's cached fragments along with it.
         """
-        logger.warning(f"Deleting post id={self.obj.id}")
+        forget_fragments(self.object)
+        logger.warning(f"Deleting post id={self.object.id}")
         messages.success(
             self.request,
             f'Entry "{self.object.title}" was deleted successfully.'
@@ -420,6 +657,9 @@ class EntrySearchView(TemplateView):
          Renders search.html with all matching entries and the bound form.
          Uses PostgreSQL full-text search across title and text fields.
 
+    Both modes match against the stored, GIN-indexed Entry.search_vector
+    and order results by SearchRank (title hits weigh more than text hits).
+
     URL: myapp/search/
     """
 
@@ -453,10 +693,12 @@ class EntrySearchView(TemplateView):
                 q = form.cleaned_data["q"]
 
                 # select_related avoids N+1 queries when template accesses author
+                query = SearchQuery(q, config=SEARCH_CONFIG)
                 results = (
                     Entry.objects.select_related("author")
-                    .annotate(search=SearchVector("title", "text"))
-                    .filter(search=SearchQuery(q))
+                    .filter(search_vector=query)
+                    .annotate(rank=SearchRank(F("search_vector"), query))
+                    .order_by("-rank", "-created_at")
                 )
                 context.update({"form": form, "q": q, "results": results})
             else:
@@ -472,22 +714,66 @@ class EntrySearchView(TemplateView):
         Expects:
             action (str): must be 'post' to trigger AJAX mode.
             ss (str): the search string typed by the user.
+            v (str): optional response format, '1' (default) or '2'.
+
+        Only pk, title and public_id are selected (no model instances are
+        built), results are cached briefly per term (see
+        myapp.search.live_search) and the payload is encoded once.
 
         Returns:
-            JsonResponse: {'search_string': <serialized JSON>}
+            v=1: JsonResponse {'search_string': <JSON string>} — the legacy
+                 django.core.serializers shape, kept for existing clients.
+            v=2: a flat JSON array [{'title': str, 'public_id': str}, ...]
         """
         if request.POST.get("action") != "post":
             return JsonResponse({"error": "Invalid action."}, status=400)
 
-        search_string = str(request.POST.get("ss", "")).strip()
+        version = request.POST.get("v", "1")
+        if version not in LIVE_SEARCH_FORMATS:
+            return JsonResponse({"error": "Unsupported response format."}, status=400)
 
-        if not search_string:
-            return JsonResponse({"search_string": "[]"}, safe=False)
+        rows = live_search(request.POST.get("ss", ""), AJAX_RESULTS_LIMIT)
+        return live_search_response(rows, version)
 
-        results = (
-            Entry.objects.annotate(search=SearchVector("title", "text"))
-            .filter(search=SearchQuery(search_string))
-            [:AJAX_RESULTS_LIMIT]
-        )
-        data = serializers.serialize("json", list(results), fields=("title", "public_id"))
-        return JsonResponse({"search_string": data}, safe=False)
\ No newline at end of file
+
+class LiveSearchAsyncView(View):
+    """
+    Async-native twin of EntrySearchView's AJAX live search: same POST
+    params and responses, with the lookup done through the async ORM and
+    cache (see myapp.search.alive_search). Served instead of the sync
+    view when settings.ASYNC_AJAX_VIEWS is on; only useful under ASGI.
+
+    URL: myapp/search/live/
+    """
+
+    async def post(self, request, *args, **kwargs):
+        if request.POST.get("action") != "post":
+            return JsonResponse({"error": "Invalid action."}, status=400)
+
+        version = request.POST.get("v", "1")
+        if version not in LIVE_SEARCH_FORMATS:
+            return JsonResponse({"error": "Unsupported response format."}, status=400)
+
+        rows = await alive_search(request.POST.get("ss", ""), AJAX_RESULTS_LIMIT)
+        return live_search_response(rows, version)
+
+
+class EntryAutocompleteView(View):
+    """
+    Returns title suggestions for a partially typed search term.
+
+    Unlike the live search POST, which only matches complete words, this
+    matches word prefixes and near-misses ("runn" -> "Running shoes")
+    through a trigram index. Results are cached per prefix and duplicate
+    in-flight prefixes are collapsed (see myapp.search).
+
+    URL query params:
+        q (str): the partial search term.
+
+    Returns:
+        JsonResponse: {'results': [{'title': str, 'public_id': str}, ...]}
+    """
+
+    def get(self, request, *args, **kwargs):
+        results = autocomplete_titles(request.GET.get("q", ""), AJAX_RESULTS_LIMIT)
+        return JsonResponse({"results": results})
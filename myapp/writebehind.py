@@ -0,0 +1,428 @@
+"""
+Write-behind buffering for like/favourite toggles.
+
+With settings.MEMBERSHIP_WRITE_BEHIND["ENABLED"], toggles are recorded in
+a per-process buffer and answered with a projected count straight away. A
+background thread coalesces them (only the last state per entry/user
+survives) into one bulk INSERT ... ON CONFLICT / DELETE statement per
+relation every FLUSH_INTERVAL seconds, so a viral entry no longer takes a
+row lock per click.
+
+Every change is first appended to a journal file. A flush rotates the
+journal and deletes it once the batch has committed, so journals left
+behind by a crashed process hold exactly the changes that never reached
+the database; they are replayed when the next buffer starts (or by the
+replay_membership_journal command). Journal lines record absolute states,
+so replaying one twice is harmless.
+"""
+import atexit
+import json
+import logging
+import os
+import socket
+import threading
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from .membership import RELATIONS, ToggleResult, invalidate_memberships
+from .models import Entry
+from .pagecache import purge_entries
+from .versions import touch_entries
+
+
+logger = logging.getLogger("daybook")
+
+DEFAULTS = {
+    "ENABLED": False,
+    # Seconds between background flushes
+    "FLUSH_INTERVAL": 1.0,
+    # Pending (entry, user) changes that force an immediate flush
+    "MAX_PENDING": 10000,
+    # Directory holding the per-process journals
+    "JOURNAL_DIR": None,
+    # fsync every journal line (survives power loss, costs a disk flush)
+    "JOURNAL_FSYNC": False,
+}
+
+_FLUSH_SQL = """
+WITH changes (entry_id, user_id, active) AS (
+    SELECT * FROM unnest(%(entry_ids)s::bigint[], %(user_ids)s::bigint[], %(states)s::boolean[])
+),
+added AS (
+    INSERT INTO {through} ({through_entry}, {through_user})
+    SELECT c.entry_id, c.user_id FROM changes c
+    WHERE c.active
+      AND EXISTS (SELECT 1 FROM {entry_table} e WHERE e.{entry_id} = c.entry_id)
+      AND EXISTS (SELECT 1 FROM {user_table} u WHERE u.{user_id} = c.user_id)
+    ON CONFLICT ({through_entry}, {through_user}) DO NOTHING
+    RETURNING {through_entry} AS entry_id
+),
+removed AS (
+    DELETE FROM {through} t USING changes c
+    WHERE NOT c.active AND t.{through_entry} = c.entry_id AND t.{through_user} = c.user_id
+    RETURNING t.{through_entry} AS entry_id
+),
+delta AS (
+    SELECT entry_id, SUM(n) AS n FROM (
+        SELECT entry_id, 1 AS n FROM added
+        UNION ALL
+        SELECT entry_id, -1 AS n FROM removed
+    ) moves GROUP BY entry_id
+)
+UPDATE {entry_table} e SET {counter} = GREATEST(e.{counter} + delta.n, 0)
+FROM delta WHERE e.{entry_id} = delta.entry_id
+"""
+
+
+# Ends the host part of a journal name; hostnames never contain it, so one
+# host's glob cannot match another's journals ("web" vs "web-2")
+_HOST_SEPARATOR = "@"
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "MEMBERSHIP_WRITE_BEHIND", {})}
+
+
+def _flush_sql(relation):
+    through, counter = RELATIONS[relation]
+    qn = connection.ops.quote_name
+    user_model = through._meta.get_field("user").related_model
+    return _FLUSH_SQL.format(
+        entry_table=qn(Entry._meta.db_table),
+        entry_id=qn(Entry._meta.pk.column),
+        user_table=qn(user_model._meta.db_table),
+        user_id=qn(user_model._meta.pk.column),
+        counter=qn(Entry._meta.get_field(counter).column),
+        through=qn(through._meta.db_table),
+        through_entry=qn(through._meta.get_field("entry").column),
+        through_user=qn(through._meta.get_field("user").column),
+    )
+
+
+def apply_changes(changes):
+    """
+    Writes {(relation, entry_id, user_id): active} to the database in one
+    transaction, one statement per relation, adjusting the counters by
+    the rows actually inserted or deleted. Changes for entries or users
+    that no longer exist are dropped.
+    """
+    by_relation = defaultdict(lambda: ([], [], []))
+    for (relation, entry_id, user_id), active in changes.items():
+        entry_ids, user_ids, states = by_relation[relation]
+        entry_ids.append(entry_id)
+        user_ids.append(user_id)
+        states.append(active)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for relation, (entry_ids, user_ids, states) in by_relation.items():
+            cursor.execute(_flush_sql(relation), {
+                "entry_ids": entry_ids, "user_ids": user_ids, "states": states,
+            })
+
+
+def read_journal(path):
+    """Returns the last recorded state per key in a journal file."""
+    changes = {}
+    with open(path, encoding="utf-8") as journal:
+        for line in journal:
+            try:
+                relation, entry_id, user_id, active = json.loads(line)
+            except ValueError:
+                # A torn last line from a crash mid-write
+                continue
+            if relation in RELATIONS:
+                changes[(relation, entry_id, user_id)] = active
+    return changes
+
+
+def replay_orphaned_journals(journal_dir):
+    """
+    Applies and removes journals whose owning process on this host is
+    gone. Each file is claimed by renaming it first, so concurrent
+    replayers never apply the same file twice. Returns the number of
+    changes replayed.
+
+    Journals carrying this process's pid are stale (a reused pid) unless
+    this process already runs a buffer, which owns them.
+    """
+    journal_dir = Path(journal_dir)
+    if not journal_dir.is_dir():
+        return 0
+
+    host = socket.gethostname()
+    replayed = 0
+    for path in sorted(journal_dir.glob(f"{host}{_HOST_SEPARATOR}*.journal*")):
+        pid = int(path.name[len(host) + 1:].split("-")[0].split(".")[0])
+        if pid == os.getpid():
+            if _buffer is not None:
+                continue
+        elif _pid_alive(pid):
+            continue
+        claimed = path.with_name(f"{path.name}.replay-{os.getpid()}")
+        try:
+            path.rename(claimed)
+        except FileNotFoundError:
+            continue
+        changes = read_journal(claimed)
+        if changes:
+            apply_changes(changes)
+            invalidate_memberships({user_id for _, _, user_id in changes})
+            entry_ids = {entry_id for _, entry_id, _ in changes}
+            touch_entries(entry_ids)
+            purge_entries(entry_ids)
+        claimed.unlink()
+        replayed += len(changes)
+        logger.info(f"Replayed {len(changes)} buffered membership changes from {path.name}")
+    return replayed
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MembershipBuffer:
+    """
+    Per-process write-behind buffer of like/favourite states.
+
+    State per (relation, entry_id, user_id) is looked up in order: pending
+    changes, the batch currently being flushed, then the database. The
+    projected count is the stored counter plus the net effect of every
+    change not yet committed. A flush commits and forgets its batch under
+    the lock, and toggle() recounts when a flush committed while it read
+    the counter, so no count includes a batch twice or misses it.
+    """
+
+    def __init__(self, flush_interval, max_pending, journal_dir=None, journal_fsync=False):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.journal_dir = Path(journal_dir) if journal_dir else None
+        self.journal_fsync = journal_fsync
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}          # key -> [state in DB, desired state]
+        self._inflight = {}         # key -> state being flushed
+        self._deltas = defaultdict(int)           # (relation, entry_id) -> count change
+        self._inflight_deltas = defaultdict(int)
+        self._flushes = 0           # batches committed so far
+        self._journal = None
+        self._journal_seq = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+        if self.journal_dir:
+            self.journal_dir.mkdir(parents=True, exist_ok=True)
+            replay_orphaned_journals(self.journal_dir)
+            self._open_journal()
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="membership-write-behind", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stopped.set()
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Membership write-behind flush failed; will retry")
+
+    def _journal_path(self):
+        return self.journal_dir / f"{socket.gethostname()}{_HOST_SEPARATOR}{os.getpid()}.journal"
+
+    def _open_journal(self):
+        self._journal = open(self._journal_path(), "a", encoding="utf-8")
+
+    def _write_journal(self, key, active):
+        if self._journal is None:
+            return
+        self._journal.write(json.dumps([*key, active]) + "\n")
+        self._journal.flush()
+        if self.journal_fsync:
+            os.fsync(self._journal.fileno())
+
+    def _rotate_journal(self):
+        """Moves the live journal aside for the batch being flushed."""
+        if self._journal is None:
+            return None
+        self._journal.close()
+        self._journal_seq += 1
+        path = self._journal_path()
+        flushing = path.with_name(f"{path.stem}-{self._journal_seq}.journal.flushing")
+        path.rename(flushing)
+        self._open_journal()
+        return flushing
+
+    def _current_state(self, key):
+        if key in self._pending:
+            return self._pending[key][1]
+        return self._inflight.get(key)
+
+    def toggle(self, relation, user_id, **lookup):
+        """
+        Records a toggle and returns the projected ToggleResult, or None
+        when no published entry matches. Only reads the database.
+        """
+        through, counter = RELATIONS[relation]
+        while True:
+            with self._lock:
+                flushes = self._flushes
+            row = Entry.published.filter(**lookup).values_list("id", "title", counter).first()
+            if row is None:
+                return None
+            entry_id, title, stored_count = row
+            key = (relation, entry_id, user_id)
+
+            with self._lock:
+                known = self._current_state(key)
+            if known is None:
+                known = through.objects.filter(entry_id=entry_id, user_id=user_id).exists()
+
+            self._lock.acquire()
+            if self._flushes == flushes:
+                break
+            # A batch committed since the counter was read, so it may or
+            # may not include the in-flight deltas that are now gone
+            self._lock.release()
+
+        try:
+            current = self._current_state(key)
+            if current is None:
+                current = known
+            desired = not current
+            self._pending.setdefault(key, [current, desired])[1] = desired
+            self._deltas[(relation, entry_id)] += 1 if desired else -1
+            self._write_journal(key, desired)
+            projected = (
+                stored_count
+                + self._deltas[(relation, entry_id)]
+                + self._inflight_deltas[(relation, entry_id)]
+            )
+            full = len(self._pending) >= self.max_pending
+        finally:
+            self._lock.release()
+
+        if full:
+            self.flush()
+        return ToggleResult(entry_id, title, desired, max(projected, 0))
+
+    def pending_states(self, user_id, relation):
+        """{entry_id: state} for this user's changes not yet committed."""
+        with self._lock:
+            states = {
+                entry_id: active
+                for (rel, entry_id, uid), active in self._inflight.items()
+                if rel == relation and uid == user_id
+            }
+            states.update({
+                entry_id: desired
+                for (rel, entry_id, uid), (_, desired) in self._pending.items()
+                if rel == relation and uid == user_id
+            })
+        return states
+
+    def flush(self):
+        """
+        Writes all pending changes in one transaction. Returns the number
+        of changes written. On failure the batch is merged back and
+        re-journaled for the next flush; a key toggled again meanwhile keeps
+        its newer state but the batch's base.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._pending
+                self._inflight = {key: desired for key, (_, desired) in batch.items()}
+                self._inflight_deltas = self._deltas
+                self._pending = {}
+                self._deltas = defaultdict(int)
+                journal = self._rotate_journal()
+
+            changes = {
+                key: desired for key, (base, desired) in batch.items() if base != desired
+            }
+            locked = False
+            try:
+                with transaction.atomic():
+                    if changes:
+                        apply_changes(changes)
+                    # Held through the commit, so toggle() sees the batch
+                    # either in flight or in the stored counters, never both
+                    self._lock.acquire()
+                    locked = True
+            except Exception:
+                if locked:
+                    self._lock.release()
+                with self._lock:
+                    for key, (base, desired) in batch.items():
+                        pending = self._pending.get(key)
+                        if pending is None:
+                            self._pending[key] = [base, desired]
+                            self._write_journal(key, desired)
+                        else:
+                            # Toggled again mid-flush: the database still
+                            # holds the failed batch's base
+                            pending[0] = base
+                        self._deltas[key[:2]] += int(desired) - int(base)
+                    self._inflight = {}
+                    self._inflight_deltas = defaultdict(int)
+                if journal is not None:
+                    journal.unlink()
+                raise
+
+            self._inflight = {}
+            self._inflight_deltas = defaultdict(int)
+            self._flushes += 1
+            self._lock.release()
+            if journal is not None:
+                journal.unlink()
+            # Cached sets, validators and anonymous pages produced while the
+            # batch was pending carry the old counters
+            invalidate_memberships({user_id for _, _, user_id in batch})
+            entry_ids = {entry_id for _, entry_id, _ in batch}
+            touch_entries(entry_ids)
+            purge_entries(entry_ids)
+            return len(changes)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """
+    Returns the process-wide MembershipBuffer (started on first use), or
+    None when write-behind is disabled.
+    """
+    global _buffer
+    config = get_config()
+    if not config["ENABLED"]:
+        return None
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = MembershipBuffer(
+                    flush_interval=config["FLUSH_INTERVAL"],
+                    max_pending=config["MAX_PENDING"],
+                    journal_dir=config["JOURNAL_DIR"],
+                    journal_fsync=config["JOURNAL_FSYNC"],
+                )
+                _buffer.start()
+    return _buffer
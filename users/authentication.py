@@ -1,28 +1,175 @@
-from django.contrib.auth.backends import BaseBackend
+import copy
+import time
+
+from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
 from django.db.models import Q
+from django.db.models.functions import Lower
+
+from daybook.cache import shared_cache
+
+from .ratelimit import client_ip, login_limiter
+
+
+# Seconds a user loaded by get_user() stays cached
+AUTH_USER_CACHE_TIMEOUT = 5 * 60
 
 
-class EmailOrUsernameModelBackend(BaseBackend):
+_dummy_hash = None
+
+
+def dummy_password_check(password):
     """
-    Custom authentication backend that allows users to log in using either their
-    username or email address.
+    Verifies `password` against a fixed hash, so an unknown identifier
+    costs exactly as much as a wrong password for a real user.
+    """
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = make_password("dummy-password")
+    check_password(password, _dummy_hash)
+
+
+def _version_key(user_id):
+    return f"auth_user_version:{user_id}"
+
+
+def user_cache_key(user_id):
+    """
+    Cache key of a user's get_user() result. Embeds the user's current
+    version, so a bump orphans copies written by requests that loaded the
+    user before the change committed.
+    """
+    # A version bump must reach every process at once, so versions skip
+    # TieredCache's per-process L1
+    versions = shared_cache()
+    version = versions.get(_version_key(user_id))
+    if version is None:
+        # Start from the clock so a lost version never reuses an old key
+        versions.add(_version_key(user_id), time.time_ns(), None)
+        version = versions.get(_version_key(user_id))
+    return f"session_user:{user_id}:{version}"
+
+
+def _without_password(user):
+    """
+    Copy of `user` (and its cached profile) for get_user()'s cache: the
+    password hash is left out, so it would be loaded from the database on
+    first access, and the session auth hash derived from it is kept
+    alongside instead.
+    """
+    cached = copy.copy(user)
+    del cached.password
+    profile = user._state.fields_cache.get("profile")
+    if profile is not None:
+        profile = copy.copy(profile)
+        profile._state.fields_cache["user"] = cached
+        cached._state.fields_cache["profile"] = profile
+    return cached, user.get_session_auth_hash()
+
+
+def _with_session_hash(user, session_hash):
+    """
+    Lets a user cached by get_user() verify its session without loading
+    the password hash. Once the password is loaded or changed (say by a
+    password change form) the hash is derived from it again.
+    """
+    derive = user.get_session_auth_hash
+
+    def get_session_auth_hash():
+        return derive() if "password" in user.__dict__ else session_hash
+
+    user.get_session_auth_hash = get_session_auth_hash
+    return user
+
+
+def invalidate_user_cache(user_id):
+    versions = shared_cache()
+    try:
+        versions.incr(_version_key(user_id))
+    except ValueError:
+        versions.set(_version_key(user_id), time.time_ns(), None)
+
+
+class EmailOrUsernameModelBackend(ModelBackend):
+    """
+    Authentication backend that allows users to log in using either their
+    username or email address, case-insensitively.
+
+    Listed ahead of ModelBackend (permissions are inherited from it) and
+    resolves the identifier with a single query. The lookups run on
+    lower(username) / lower(email), which the functional indexes from
+    users.0005 serve. get_user() results are cached per user.
     """
 
     def authenticate(self, request, username=None, password=None, **kwargs):
+        """
+        Checks the limits in users.ratelimit before touching the database
+        or hashing anything; a throttled attempt raises PermissionDenied,
+        which makes django.contrib.auth.authenticate() give up at once,
+        and flags the request so the login form can say why. Failures
+        count against both the identifier and the client IP, and raise
+        PermissionDenied too, so ModelBackend does not look the user up
+        and hash the password a second time.
+        """
         user_model = get_user_model()
-        
-        try:
-            user = user_model.objects.get(Q(username=username) | Q(email=username))
-            if user.check_password(password):
-                return user
-        except user_model.DoesNotExist:
+        if username is None:
+            username = kwargs.get(user_model.USERNAME_FIELD)
+        if username is None or password is None:
             return None
 
-    def get_user(self, user_id):
-        User = get_user_model()
+        identifier = username.lower()
+        ip = client_ip(request)
+        limit = login_limiter.exceeded(identifier=identifier, ip=ip)
+        if limit is not None:
+            login_limiter.reject(limit)
+            if request is not None:
+                request.login_throttled = True
+            raise PermissionDenied
+
+        candidates = list(
+            user_model._default_manager.alias(
+                username_lower=Lower("username"), email_lower=Lower("email")
+            ).filter(Q(username_lower=identifier) | Q(email_lower=identifier))[:5]
+        )
+        # An exact username beats a case-insensitive one, which beats an email
+        candidates.sort(key=lambda user: (
+            user.username != username,
+            user.username.lower() != identifier,
+            user.pk,
+        ))
 
-        try:
-            return User.objects.get(pk=user_id)
-        except User.DoesNotExist:
-            return None
\ No newline at end of file
+        if candidates:
+            user = candidates[0]
+            if user.check_password(password) and self.user_can_authenticate(user):
+                login_limiter.reset(identifier=identifier)
+                return user
+        else:
+            dummy_password_check(password)
+
+        login_limiter.hit(identifier=identifier, ip=ip)
+        raise PermissionDenied
+
+    def get_user(self, user_id):
+        """
+        Returns the user for a session, with its profile, from the cache
+        when possible. Saves of the user or its profile bump the version
+        (see users.signals), which makes older copies unreachable. The
+        cached copy holds no password hash, only the session auth hash.
+        """
+        key = user_cache_key(user_id)
+        cached = cache.get(key)
+        if cached is not None:
+            user = _with_session_hash(*cached)
+        else:
+            user = (
+                get_user_model()._default_manager.select_related("profile")
+                .filter(pk=user_id)
+                .first()
+            )
+            if user is None:
+                return None
+            cache.set(key, _without_password(user), AUTH_USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
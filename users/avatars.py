@@ -0,0 +1,138 @@
+"""
+Off-request avatar processing.
+
+Profile.save() hands changed images to schedule_avatar(), which runs
+process_avatar() on a small thread pool after the transaction commits.
+Each image is hashed and rendered once into AVATAR_SIZES square variants
+in every AVATAR_FORMATS format. Variant names derive from the content
+hash, so identical uploads (and the shared default image) are only ever
+encoded once. The process_avatars command does the same synchronously
+for backfills.
+"""
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from PIL import Image, ImageOps
+
+from .authentication import invalidate_user_cache
+from .models import Profile
+
+
+logger = logging.getLogger("daybook")
+
+# Square edge lengths, in pixels, of the generated variants
+AVATAR_SIZES = (64, 160, 300)
+# Pillow format name and quality per variant extension
+AVATAR_FORMATS = {
+    "webp": ("WEBP", 80),
+    "jpeg": ("JPEG", 85),
+}
+# Storage directory of the variants
+AVATAR_VARIANT_DIR = "profile_pics/variants"
+# Background workers per process; decoding is CPU-bound, so keep it small
+AVATAR_WORKERS = 2
+
+_executor = ThreadPoolExecutor(max_workers=AVATAR_WORKERS, thread_name_prefix="avatars")
+# Profiles queued but not yet started; repeated saves share one run
+_queued = set()
+_queued_lock = threading.Lock()
+
+
+def schedule_avatar(profile_id):
+    """Queues process_avatar() for a profile unless it is already queued."""
+    with _queued_lock:
+        if profile_id in _queued:
+            return None
+        _queued.add(profile_id)
+    return _executor.submit(_run, profile_id)
+
+
+def _run(profile_id):
+    with _queued_lock:
+        _queued.discard(profile_id)
+    close_old_connections()
+    try:
+        return process_avatar(profile_id)
+    except Exception:
+        logger.exception(f"Processing avatar of profile {profile_id} failed")
+    finally:
+        close_old_connections()
+
+
+def variant_name(digest, size, extension):
+    return f"{AVATAR_VARIANT_DIR}/{digest[:2]}/{digest}-{size}.{extension}"
+
+
+def render_variants(data, digest):
+    """
+    Encodes every missing variant of an image and returns the variant map.
+    The image is not even decoded when all variants already exist.
+
+    JPEG sources are decoded with Image.draft(), which lets libjpeg scale
+    by 1/2, 1/4 or 1/8 while decoding, so a large photo is never fully
+    decompressed just to produce a 300px avatar.
+    """
+    variants = {
+        str(size): {extension: variant_name(digest, size, extension) for extension in AVATAR_FORMATS}
+        for size in AVATAR_SIZES
+    }
+    missing = {
+        (size, extension)
+        for size, names in variants.items()
+        for extension, name in names.items()
+        if not default_storage.exists(name)
+    }
+    if not missing:
+        return variants
+
+    image = Image.open(BytesIO(data))
+    largest = max(AVATAR_SIZES)
+    image.draft("RGB", (largest, largest))
+    image = ImageOps.exif_transpose(image).convert("RGB")
+
+    for size in sorted(AVATAR_SIZES, reverse=True):
+        # Each smaller size is cut from the previous, already reduced one
+        image = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+        for extension, (fmt, quality) in AVATAR_FORMATS.items():
+            if (str(size), extension) not in missing:
+                continue
+            buffer = BytesIO()
+            image.save(buffer, fmt, quality=quality, optimize=True)
+            variants[str(size)][extension] = default_storage.save(
+                variants[str(size)][extension], ContentFile(buffer.getvalue())
+            )
+    return variants
+
+
+def process_avatar(profile_id, force=False):
+    """
+    Builds the variants of a profile's current image unless its content
+    hash is unchanged. Returns True if the profile was updated.
+    """
+    profile = Profile.objects.filter(pk=profile_id).only("user_id", "image", "image_hash", "image_variants").first()
+    if profile is None or not profile.image:
+        return False
+
+    name = profile.image.name
+    with profile.image.open("rb") as image_file:
+        data = image_file.read()
+    digest = hashlib.sha256(data).hexdigest()
+    if digest == profile.image_hash and profile.image_variants and not force:
+        return False
+
+    variants = render_variants(data, digest)
+    # Skip the write if the image was replaced meanwhile; that save has
+    # scheduled its own run
+    updated = Profile.objects.filter(pk=profile_id, image=name).update(
+        image_hash=digest, image_variants=variants
+    )
+    if updated:
+        # update() sends no signals; drop the copy get_user() cached
+        invalidate_user_cache(profile.user_id)
+    return bool(updated)
@@ -1,5 +1,5 @@
 from django import forms
-from django.contrib.auth.forms import UserCreationForm, PasswordChangeForm
+from django.contrib.auth.forms import AuthenticationForm, UserCreationForm, PasswordChangeForm
 from django.contrib.auth import get_user_model
 from .models import Profile
 
@@ -68,4 +68,19 @@ class UserPasswordChangeForm(PasswordChangeForm):
 
     class Meta:
         model = get_user_model()
-        fields = ('old_password', 'new_password1', 'new_password2')     
\ No newline at end of file
+        fields = ('old_password', 'new_password1', 'new_password2')     
+
+
+class ThrottledAuthenticationForm(AuthenticationForm):
+    """
+    Login form that tells rate-limited users to wait instead of reporting
+    wrong credentials (see users.ratelimit).
+    """
+
+    def get_invalid_login_error(self):
+        if getattr(self.request, "login_throttled", False):
+            return forms.ValidationError(
+                "Too many failed login attempts. Please try again later.",
+                code="throttled",
+            )
+        return super().get_invalid_login_error()
@@ -0,0 +1,179 @@
+"""
+Outbox for transactional mail.
+
+Views call queue_mail(), which only inserts an OutboundEmail row. The
+send_queued_mail command claims due rows in batches, renders their HTML
+templates and sends them over one reused SMTP connection, retrying
+failures with exponential backoff.
+"""
+import logging
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+
+logger = logging.getLogger("daybook")
+
+# Attempts before a message is marked failed for good
+MAIL_MAX_ATTEMPTS = 6
+# Seconds before the first retry; doubles with every further attempt
+MAIL_RETRY_BASE = 30
+# Upper bound on the retry delay, in seconds
+MAIL_RETRY_MAX = 60 * 60
+# Seconds a claimed message is hidden from other workers while being sent
+MAIL_CLAIM_TIMEOUT = 5 * 60
+
+
+def queue_mail(subject, body, to, html_template="", context=None, from_email=None):
+    """
+    Queues a message for the send_queued_mail worker and returns the row.
+
+    `html_template` (optional) is rendered with `context` at send time, so
+    `context` must be JSON-serializable.
+    """
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(to),
+        html_template=html_template,
+        context=context or {},
+    )
+
+
+def retry_delay(attempts):
+    """Seconds to wait after the given number of failed attempts, with jitter."""
+    delay = min(MAIL_RETRY_BASE * 2 ** (attempts - 1), MAIL_RETRY_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_batch(batch_size):
+    """
+    Claims up to `batch_size` due messages and returns them.
+
+    Rows are locked with SKIP LOCKED, so concurrent workers take disjoint
+    batches, and pushed MAIL_CLAIM_TIMEOUT into the future before the lock
+    is released. A worker that dies mid-batch therefore only delays its
+    messages; another worker picks them up once the claim times out.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboundEmail.Status.PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at")[:batch_size]
+        )
+        OutboundEmail.objects.filter(pk__in=[message.pk for message in batch]).update(
+            attempts=F("attempts") + 1,
+            next_attempt_at=now + timedelta(seconds=MAIL_CLAIM_TIMEOUT),
+        )
+    for message in batch:
+        message.attempts += 1
+    return batch
+
+
+def build_message(message, connection):
+    email = EmailMultiAlternatives(
+        subject=message.subject,
+        body=message.body,
+        from_email=message.from_email,
+        to=message.to,
+        connection=connection,
+    )
+    if message.html_template:
+        email.attach_alternative(
+            render_to_string(message.html_template, message.context), "text/html"
+        )
+    return email
+
+
+def _record_failure(message, error):
+    message.last_error = f"{type(error).__name__}: {error}"
+    if message.attempts >= MAIL_MAX_ATTEMPTS:
+        message.status = OutboundEmail.Status.FAILED
+    else:
+        message.next_attempt_at = timezone.now() + timedelta(seconds=retry_delay(message.attempts))
+    message.save(update_fields=["status", "next_attempt_at", "last_error"])
+
+
+def deliver_batch(batch, connection):
+    """
+    Sends a claimed batch over an open connection and records the outcome
+    of every message. Returns {'sent', 'retried', 'failed'} counts.
+
+    A failed send closes the connection (it may be half-broken) and opens
+    a fresh one; left closed, the backend would open and close a
+    connection for every remaining message.
+    """
+    stats = {"sent": 0, "retried": 0, "failed": 0}
+    sent_ids = []
+    for message in batch:
+        try:
+            build_message(message, connection).send()
+        except Exception as error:
+            logger.warning(f"Sending mail {message.pk} failed (attempt {message.attempts}): {error}")
+            connection.close()
+            try:
+                connection.open()
+            except Exception as reopen_error:
+                # The next send opens its own connection and tries again
+                logger.warning(f"Reopening the mail connection failed: {reopen_error}")
+            _record_failure(message, error)
+            stats["failed" if message.status == OutboundEmail.Status.FAILED else "retried"] += 1
+        else:
+            sent_ids.append(message.pk)
+
+    if sent_ids:
+        OutboundEmail.objects.filter(pk__in=sent_ids).update(
+            status=OutboundEmail.Status.SENT, sent_at=timezone.now(), last_error=""
+        )
+    stats["sent"] = len(sent_ids)
+    return stats
+
+
+def send_queued_mail(batch_size=100, loop=False, interval=5.0, stdout=None):
+    """
+    Delivers due mail until the queue is drained (or forever with `loop`),
+    reusing one SMTP connection for every batch. Returns the totals.
+    """
+    totals = {"sent": 0, "retried": 0, "failed": 0}
+    connection = get_connection()
+    started = time.monotonic()
+    try:
+        while True:
+            batch = claim_batch(batch_size)
+            if not batch:
+                if not loop:
+                    break
+                connection.close()
+                time.sleep(interval)
+                continue
+
+            batch_started = time.monotonic()
+            connection.open()
+            stats = deliver_batch(batch, connection)
+            elapsed = time.monotonic() - batch_started
+            for name, count in stats.items():
+                totals[name] += count
+            line = (
+                f"Mail batch: {stats['sent']} sent, {stats['retried']} retried, "
+                f"{stats['failed']} failed in {elapsed:.2f}s "
+                f"({stats['sent'] / elapsed if elapsed else 0:.1f} msg/s)"
+            )
+            logger.info(line)
+            if stdout is not None:
+                stdout.write(line)
+    finally:
+        connection.close()
+
+    totals["elapsed"] = time.monotonic() - started
+    return totals
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from users.avatars import process_avatar
+from users.models import Profile
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds the pre-sized avatar variants synchronously. Only profiles "
+        "without variants are processed unless --all is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            dest="process_all",
+            help="Re-encode every profile, e.g. after changing AVATAR_SIZES.",
+        )
+
+    def handle(self, *args, process_all, **options):
+        profiles = Profile.objects.all() if process_all else Profile.objects.filter(image_hash="")
+        processed = failed = 0
+
+        for profile_id in profiles.order_by("id").values_list("id", flat=True).iterator():
+            try:
+                if process_avatar(profile_id, force=process_all):
+                    processed += 1
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f"Profile {profile_id}: {error}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {processed} avatars ({failed} failed)."
+        ))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from users.mail import send_queued_mail
+
+
+class Command(BaseCommand):
+    help = (
+        "Delivers mail queued in the outbox (users.OutboundEmail) in batches "
+        "over one SMTP connection, retrying failures with exponential backoff. "
+        "Several workers may run at once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Messages claimed and sent per batch (default: 100).",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling for new mail instead of exiting once the queue is drained.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds between polls of an empty queue with --loop (default: 5).",
+        )
+
+    def handle(self, *args, batch_size, loop, interval, **options):
+        totals = send_queued_mail(batch_size, loop, interval, stdout=self.stdout)
+        rate = totals["sent"] / totals["elapsed"] if totals["elapsed"] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {totals['sent']} messages ({totals['retried']} to retry, "
+            f"{totals['failed']} failed) in {totals['elapsed']:.2f}s, {rate:.1f} msg/s."
+        ))
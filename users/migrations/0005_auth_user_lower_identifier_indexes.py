@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:10
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_profile_image_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # auth_user belongs to django.contrib.auth, so the functional indexes
+    # behind EmailOrUsernameModelBackend's lower() lookups are raw SQL.
+    operations = [
+        migrations.RunSQL(
+            sql="CREATE INDEX IF NOT EXISTS users_auth_user_lower_email ON auth_user (lower(email));",
+            reverse_sql="DROP INDEX IF EXISTS users_auth_user_lower_email;",
+        ),
+        migrations.RunSQL(
+            sql="CREATE INDEX IF NOT EXISTS users_auth_user_lower_username ON auth_user (lower(username));",
+            reverse_sql="DROP INDEX IF EXISTS users_auth_user_lower_username;",
+        ),
+    ]
@@ -1,22 +1,89 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
-from PIL import Image
+from django.utils import timezone
 
 # Create your models here.
 class Profile(models.Model):
     user = models.OneToOneField(get_user_model(), on_delete=models.CASCADE)
     image = models.ImageField(default='default.png', upload_to='profile_pics')
     is_verified = models.BooleanField(default=False)
+    # SHA-256 of the image the variants were built from
+    image_hash = models.CharField(max_length=64, blank=True, editable=False)
+    # {"<size>": {"webp": <storage name>, "jpeg": <storage name>}}, filled in
+    # by users.avatars off the request
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f'{self.user.username} Profile'
-    
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored image so save() can tell whether it changed
+        if "image" in field_names:
+            instance._loaded_image = values[field_names.index("image")]
+        return instance
+
     def save(self, *args, **kwargs):
+        """
+        Saves the profile and, if the image changed (or was never processed),
+        schedules variant generation once the transaction commits. No image
+        is opened here.
+        """
         super().save(*args, **kwargs)
 
-        img = Image.open(self.image.path)
+        image_changed = self.image.name != getattr(self, "_loaded_image", None)
+        self._loaded_image = self.image.name
+        if image_changed or not self.image_hash:
+            from .avatars import schedule_avatar
+
+            transaction.on_commit(lambda: schedule_avatar(self.pk))
+
+    def avatar_url(self, size=160, format="webp"):
+        """
+        URL of the smallest pre-sized variant at least `size` pixels wide
+        (the largest one if none is), or of the original image while the
+        variants are still being built.
+        """
+        sizes = sorted(int(key) for key in self.image_variants)
+        if not sizes:
+            return self.image.url
+        chosen = next((s for s in sizes if s >= size), sizes[-1])
+        return self.image.storage.url(self.image_variants[str(chosen)][format])
+
+
+class OutboundEmail(models.Model):
+    """
+    A queued email, delivered by the send_queued_mail command (see users/mail.py).
 
-        if img.width > 300 or img.height > 300:
-            output_size = (300, 300)
-            img.thumbnail(output_size)
-            img.save(self.image.path)
+    The plain-text body is stored as is; the HTML alternative is stored as a
+    template name plus JSON context and only rendered by the worker, so the
+    request that queues the mail does no rendering and no SMTP.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        SENT = "sent", "Sent"
+        FAILED = "failed", "Failed"
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField(default=list)
+    html_template = models.CharField(max_length=255, blank=True)
+    context = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker's claim query: due pending mail, oldest first
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} to {", ".join(self.to)} ({self.status})'
@@ -0,0 +1,175 @@
+"""
+Sliding-window limits on failed logins.
+
+EmailOrUsernameModelBackend consults login_limiter before it runs any
+query or password hash, so a credential-stuffing burst is turned away for
+the cost of one cache round trip instead of one PBKDF2 run per guess.
+Failures are counted per login identifier and per client IP in the shared
+cache; if that cache is unreachable, each process falls back to counting
+in memory.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+from daybook.cache import shared_cache
+
+
+logger = logging.getLogger("daybook")
+
+# Seconds covered by the sliding window
+LOGIN_WINDOW = 15 * 60
+# Failed logins allowed per identifier (username or email) within the window
+LOGIN_IDENTIFIER_LIMIT = 5
+# Failed logins allowed per client IP within the window
+LOGIN_IP_LIMIT = 50
+
+# Attempts rejected by this process since it started, per scope
+rejected_attempts = Counter()
+
+
+class LocalWindowStore:
+    """In-process stand-in for the shared cache's add/incr/get_many."""
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                key: self._counts[key][0]
+                for key in keys
+                if key in self._counts and self._counts[key][1] > now
+            }
+
+    def incr(self, key, timeout):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._counts) > 10000:
+                self._counts = {k: v for k, v in self._counts.items() if v[1] > now}
+            count, expires_at = self._counts.get(key, (0, now + timeout))
+            if expires_at <= now:
+                count, expires_at = 0, now + timeout
+            self._counts[key] = (count + 1, expires_at)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._counts.pop(key, None)
+
+
+class SlidingWindowLimiter:
+    """
+    Approximate sliding-window counter.
+
+    Events are counted in fixed buckets of `window` seconds; the rate over
+    the last `window` seconds is the current bucket plus the previous one
+    weighted by how much of it still overlaps the window. That costs two
+    counters per key rather than one timestamp per event, and one
+    get_many() covers every key checked.
+    """
+
+    def __init__(self, scope, limits, window):
+        self.scope = scope
+        self.limits = limits
+        self.window = window
+        self._fallback = LocalWindowStore()
+
+    def _keys(self, name, value, bucket):
+        digest = hashlib.md5(value.encode()).hexdigest()
+        return (
+            f"ratelimit:{self.scope}:{name}:{digest}:{bucket}",
+            f"ratelimit:{self.scope}:{name}:{digest}:{bucket - 1}",
+        )
+
+    def _bucket(self):
+        now = time.time()
+        return int(now // self.window), (now % self.window) / self.window
+
+    def _values(self, values):
+        return [(name, value) for name, value in values.items() if value and name in self.limits]
+
+    def exceeded(self, **values):
+        """
+        Returns the name of the first limit `values` (e.g. identifier=...,
+        ip=...) is over, or None.
+        """
+        bucket, elapsed = self._bucket()
+        checks = {name: self._keys(name, value, bucket) for name, value in self._values(values)}
+        keys = [key for pair in checks.values() for key in pair]
+        try:
+            counts = shared_cache().get_many(keys)
+        except Exception:
+            counts = self._fallback.get_many(keys)
+
+        for name, (current, previous) in checks.items():
+            rate = counts.get(current, 0) + counts.get(previous, 0) * (1 - elapsed)
+            if rate >= self.limits[name]:
+                return name
+        return None
+
+    def hit(self, **values):
+        """Counts one event against every given key."""
+        bucket, _ = self._bucket()
+        # Buckets must survive into the next window, where they are "previous"
+        timeout = self.window * 2
+        for name, value in self._values(values):
+            key = self._keys(name, value, bucket)[0]
+            try:
+                cache = shared_cache()
+                cache.add(key, 0, timeout)
+                cache.incr(key)
+            except Exception:
+                self._fallback.incr(key, timeout)
+
+    def reset(self, **values):
+        bucket, _ = self._bucket()
+        keys = [key for name, value in self._values(values) for key in self._keys(name, value, bucket)]
+        try:
+            shared_cache().delete_many(keys)
+        except Exception:
+            pass
+        self._fallback.delete_many(keys)
+
+    def reject(self, limit):
+        """Records a rejected attempt for the metrics."""
+        rejected_attempts[limit] += 1
+        logger.warning(
+            f"Rate limit '{self.scope}:{limit}' rejected an attempt "
+            f"({rejected_attempts[limit]} rejected by this process)"
+        )
+
+
+login_limiter = SlidingWindowLimiter(
+    "login",
+    limits={"identifier": LOGIN_IDENTIFIER_LIMIT, "ip": LOGIN_IP_LIMIT},
+    window=LOGIN_WINDOW,
+)
+
+
+def client_ip(request):
+    """
+    The client's address. Behind settings.RATELIMIT_TRUSTED_PROXY_COUNT
+    reverse proxies, each appending to X-Forwarded-For, that is the entry
+    the outermost trusted proxy added (the count-th from the right);
+    anything to its left is client-controlled. Falls back to REMOTE_ADDR
+    without trusted proxies or when the header is shorter than expected.
+    """
+    if request is None:
+        return ""
+    proxies = getattr(settings, "RATELIMIT_TRUSTED_PROXY_COUNT", 0)
+    if proxies > 0:
+        forwarded = [
+            address.strip()
+            for address in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")
+            if address.strip()
+        ]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get("REMOTE_ADDR", "")
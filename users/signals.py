@@ -1,6 +1,7 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.contrib.auth import get_user_model
 from django.dispatch import receiver
+from .authentication import invalidate_user_cache
 from .models import Profile
 
 
@@ -10,5 +11,19 @@ def create_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
 
 @receiver(post_save, sender=get_user_model())
-def save_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
+def save_profile(sender, instance, update_fields=None, **kwargs):
+    # Partial saves (e.g. last_login on every login) never touch the profile
+    if update_fields:
+        return
+    instance.profile.save()
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def evict_cached_user(sender, instance, **kwargs):
+    invalidate_user_cache(instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+def evict_cached_user_profile(sender, instance, **kwargs):
+    invalidate_user_cache(instance.user_id)
@@ -1,3 +1,120 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user, get_user_model
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+
+from . import authentication
+from .authentication import EmailOrUsernameModelBackend, user_cache_key
+from .forms import ThrottledAuthenticationForm
+from .ratelimit import LOGIN_IDENTIFIER_LIMIT, LOGIN_IP_LIMIT, login_limiter
+
+
+# Per-test-run caches, so cached users and limiter counts start from nothing
+TEST_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "users-tests"}}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class GetUserCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user("ann", "ann@example.com", password="pw-1")
+        self.client.login(username="ann", password="pw-1")
+
+    def session_user(self, queries=None):
+        """The user django.contrib.auth resolves for the logged-in session."""
+        request = RequestFactory().get("/")
+        request.session = self.client.session
+        request.session.keys()  # loaded here, not in the counted queries
+        if queries is None:
+            return get_user(request)
+        with self.assertNumQueries(queries):
+            return get_user(request)
+
+    def test_cached_copy_holds_no_password_hash(self):
+        EmailOrUsernameModelBackend().get_user(self.user.pk)
+
+        cached, session_hash = cache.get(user_cache_key(self.user.pk))
+        self.assertNotIn("password", cached.__dict__)
+        self.assertEqual(session_hash, self.user.get_session_auth_hash())
+
+    def test_session_is_verified_from_the_cached_copy(self):
+        self.assertEqual(self.session_user(), self.user)
+        user = self.session_user(queries=0)
+        self.assertEqual(user, self.user)
+        self.assertEqual(user.profile.user, user)
+
+    def test_password_change_ends_other_sessions(self):
+        self.session_user()
+        user = get_user_model().objects.get(pk=self.user.pk)
+        user.set_password("pw-2")
+        user.save()
+
+        self.assertFalse(self.session_user().is_authenticated)
+
+    def test_cached_copy_loads_the_password_when_checking_it(self):
+        self.session_user()
+        user = self.session_user()
+        self.assertTrue(user.check_password("pw-1"))
+        self.assertEqual(user.get_session_auth_hash(), self.user.get_session_auth_hash())
+
+
+@override_settings(CACHES=TEST_CACHES, PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user("ann", "ann@example.com", password="pw-1")
+        # Pins the sliding window to the start of one bucket
+        patcher = mock.patch.object(login_limiter, "_bucket", return_value=(1000, 0.0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def login(self, username, password, ip="10.0.0.1"):
+        """Submits the login form; returns its errors (empty on success)."""
+        request = RequestFactory().post("/", REMOTE_ADDR=ip)
+        form = ThrottledAuthenticationForm(request, data={"username": username, "password": password})
+        form.is_valid()
+        return form.errors.get("__all__", [])
+
+    def test_identifier_is_locked_after_repeated_failures(self):
+        for _ in range(LOGIN_IDENTIFIER_LIMIT):
+            self.assertIn("correct username and password", self.login("ann", "wrong")[0])
+
+        with (
+            self.assertLogs("daybook", "WARNING"),
+            mock.patch.object(get_user_model(), "check_password") as check_password,
+        ):
+            errors = self.login("ANN", "pw-1")
+        self.assertIn("Too many failed login attempts", errors[0])
+        check_password.assert_not_called()
+        # Other identifiers from the same IP still get a real answer
+        self.assertIn("correct username and password", self.login("nobody", "wrong")[0])
+
+    def test_ip_is_locked_after_failures_across_identifiers(self):
+        for number in range(LOGIN_IP_LIMIT):
+            self.login(f"user{number}", "wrong")
+
+        with self.assertLogs("daybook", "WARNING"):
+            self.assertIn("Too many failed login attempts", self.login("ann", "pw-1")[0])
+        self.assertEqual(self.login("ann", "pw-1", ip="10.0.0.2"), [])
+
+    def test_success_resets_the_identifier_count(self):
+        for _ in range(LOGIN_IDENTIFIER_LIMIT - 1):
+            self.login("ann", "wrong")
+        self.assertEqual(self.login("ann@example.com", "pw-1"), [])
+        self.assertEqual(self.login("ann", "pw-1"), [])
+
+        for _ in range(LOGIN_IDENTIFIER_LIMIT - 1):
+            self.login("ann", "wrong")
+        self.assertEqual(self.login("ann", "pw-1"), [])
+
+    def test_unknown_and_known_usernames_get_the_same_answer(self):
+        with mock.patch.object(
+            authentication, "dummy_password_check", wraps=authentication.dummy_password_check
+        ) as dummy_password_check:
+            known = self.login("ann", "wrong")
+            dummy_password_check.assert_not_called()
+            unknown = self.login("nobody", "wrong")
+            dummy_password_check.assert_called_once_with("wrong")
+
+        self.assertEqual(known, unknown)
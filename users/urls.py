@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 
 from . import views
@@ -13,6 +14,9 @@ urlpatterns = [
     path('password-change/', views.UserPasswordChangeView.as_view(), name='password_change'),
 
     path('profile/favorites/', views.FavouriteListView.as_view(), name='favorite_list'),
+    path('profile/export/', views.EntryExportView.as_view(), name='entry-export'),
     path('fav/<uuid:public_id>/', views.FavoriteToggleView.as_view(), name='favorite_add'),
-    path('like/', views.LikeToggleView.as_view(), name='like'),
+    path('like/', (
+        views.LikeToggleAsyncView if settings.ASYNC_AJAX_VIEWS else views.LikeToggleView
+    ).as_view(), name='like'),
 ]
\ No newline at end of file
@@ -1,17 +1,27 @@
-from django.http import HttpResponseRedirect, JsonResponse
-from django.shortcuts import get_object_or_404, redirect, render
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect, render
 from django.views.generic import CreateView, UpdateView, TemplateView
 from django.urls import reverse_lazy, reverse
 from .forms import CustomUserCreationForm, UserPasswordChangeForm, UserProfileForm
 from django.contrib.auth import get_user_model, login
 from myapp.models import Entry
+from myapp.membership import get_memberships, toggle
+from myapp.pagination import CursorPaginator
+from myapp.recent import get_recent_entries
+from myapp.transfer import CSVEncoder, encode_jsonl, export_rows
+from myapp.utils import AsyncLoginRequiredMixin
 from django.contrib.auth.views import PasswordChangeView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.views import View
-from django.template.loader import render_to_string
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
 from datetime import datetime
+from .mail import queue_mail
 from .utils import generate_verification_token, verify_token
 
 
@@ -45,7 +55,8 @@ class RegisterView(UserPassesTestMixin, CreateView):
 
     def form_valid(self, form):
         """
-        Saves the new user and logs them in immediately.
+        Saves the new user and queues the verification email (delivered by
+        the send_queued_mail worker, so SMTP never delays the response).
         """
         response = super().form_valid(form)  # saves the user → self.object
 
@@ -54,12 +65,11 @@ class RegisterView(UserPassesTestMixin, CreateView):
         verify_url = self.request.build_absolute_uri(
             reverse("users:verify-email", kwargs={"token": token})
         )
-        send_mail(
+        queue_mail(
             subject="Verify your email address",
-            message=f"Hi {self.object.username},\n\nClick the link below \
+            body=f"Hi {self.object.username},\n\nClick the link below \
             to verify your email:\n{verify_url}\n\nThe link expires in 24 hours.",
-            from_email="noreply@yoursite.com",
-            recipient_list=[self.object.email],
+            to=[self.object.email],
         )
 
         return redirect(reverse("users:verification-pending"))
@@ -86,7 +96,7 @@ def verify_email(request, token):
         profile.save()
 
     # Now log them in
-    login(request, user, backend="django.contrib.auth.backends.ModelBackend")
+    login(request, user, backend="users.authentication.EmailOrUsernameModelBackend")
     return redirect(reverse_lazy("myapp:entry-list"))
 
 
@@ -110,17 +120,17 @@ def resend_verification(request):
             verify_url = request.build_absolute_uri(
                 reverse("users:verify-email", kwargs={"token": token})
             )
-            html_message = render_to_string("users/verification_email.html", {
-                "user": user,
-                "verify_url": verify_url,
-                "year": datetime.now().year,
-            })
-            send_mail(
+            # The HTML part is rendered by the mail worker, not here
+            queue_mail(
                 subject="Verify your email address",
-                message=f"Verify here: {verify_url}",
-                from_email="noreply@yoursite.com",
-                recipient_list=[user.email],
-                html_message=html_message,
+                body=f"Verify here: {verify_url}",
+                to=[user.email],
+                html_template="users/verification_email.html",
+                context={
+                    "user": {"username": user.username, "email": user.email},
+                    "verify_url": verify_url,
+                    "year": datetime.now().year,
+                },
             )
         except User.DoesNotExist:
             pass  # Don't reveal whether the email exists
@@ -218,18 +228,24 @@ class FavoriteToggleView(LoginRequiredMixin, View):
     def post(self, request, *args, **kwargs):
         """
         Handles the favourite toggle on POST.
+
+        The lookup, toggle and counter update run as one atomic statement,
+        or go through the write-behind buffer when it is enabled (see
+        myapp.membership.toggle).
         """
-        entry = get_object_or_404(Entry, public_id=kwargs["public_id"])
+        result = toggle(
+            "favorites", request.user.id, public_id=kwargs["public_id"]
+        )
+        if result is None:
+            raise Http404("No entry found matching the query.")
 
-        if entry.favorites.filter(id=request.user.id).exists():
-            entry.favorites.remove(request.user)
-            messages.success(request, f'"{entry.title}" removed from your favourites.')
+        if result.active:
+            messages.success(request, f'"{result.title}" added to your favourites.')
         else:
-            entry.favorites.add(request.user)
-            messages.success(request, f'"{entry.title}" added to your favourites.')
+            messages.success(request, f'"{result.title}" removed from your favourites.')
 
         # Fall back to entry detail if the referrer header is absent
-        fallback_url = entry.get_absolute_url()
+        fallback_url = reverse("myapp:entry-detail", kwargs={"public_id": kwargs["public_id"]})
         redirect_url = request.META.get("HTTP_REFERER", fallback_url)
         return HttpResponseRedirect(redirect_url)
 
@@ -240,13 +256,20 @@ class FavouriteListView(LoginRequiredMixin, TemplateView):
 
     Two querysets are provided to the template:
       - 'favourites': all entries the user has marked as favourite.
-      - 'visited': recently viewed entries stored in the session, preserved
-        in the order they were visited (most recent last).
+      - 'visited': recently viewed entries from the signed 'recent_entries'
+        cookie (see myapp.recent), preserved in the order they were visited
+        (most recent last).
+    plus 'liked_ids' / 'favorited_ids' for the entries in both lists.
+
+    Passing the 'cursor' query param (empty for the first page) opts in to
+    keyset pagination of the favourites; 'page_obj' then carries the
+    next/previous cursors.
 
     Access: login required — unauthenticated users are redirected to LOGIN_URL.
     """
 
     template_name = "users/favorites.html"
+    paginate_by = 10
 
     def get_context_data(self, **kwargs):
         """
@@ -260,21 +283,34 @@ class FavouriteListView(LoginRequiredMixin, TemplateView):
             .select_related("author")
         )
 
-        # Restore session visit order — filter() does not guarantee id__in order
-        recent_ids = self.request.session.get("recent_entries", [])
+        if "cursor" in self.request.GET:
+            page = CursorPaginator(
+                context["favorites"].order_by("-created_at"), self.paginate_by
+            ).page(self.request.GET.get("cursor") or None)
+            context["favorites"] = page.object_list
+            context["page_obj"] = page
+
+        # Restore visit order — filter() does not guarantee id__in order
+        recent_ids = get_recent_entries(self.request)
         recent_qs = (
             Entry.objects.filter(id__in=recent_ids)
             .select_related("author")
         )
 
-        # Re-sort the queryset to match the session order (most recent last)
+        # Re-sort the queryset to match the visit order (most recent last)
         recent_map = {entry.id: entry for entry in recent_qs}
         context["visited"] = [
             recent_map[entry_id]
             for entry_id in recent_ids
-            if entry_id in recent_map      # Guard against stale session IDs
+            if entry_id in recent_map      # Guard against stale IDs
         ]
 
+        # Iterating fills the favourites queryset's cache for the template
+        shown_ids = [entry.id for entry in context["favorites"]] + list(recent_map)
+        memberships = get_memberships(self.request.user, shown_ids)
+        context["liked_ids"] = memberships.liked
+        context["favorited_ids"] = memberships.favorited
+
         return context
 
 
@@ -311,22 +347,168 @@ class LikeToggleView(LoginRequiredMixin, View):
         if not raw_id or not raw_id.strip().isdigit():
             return JsonResponse({"error": "Invalid entry ID."}, status=400)
 
-        entry = get_object_or_404(Entry, id=int(raw_id))
-
-        if entry.likes.filter(id=request.user.id).exists():
-            entry.likes.remove(request.user)
-            liked = False
-        else:
-            entry.likes.add(request.user)
-            liked = True
+        # Lookup, toggle and new count in one round trip, or a projected
+        # count from the write-behind buffer (see myapp.membership.toggle)
+        result = toggle("likes", request.user.id, id=int(raw_id))
+        if result is None:
+            raise Http404("No entry found matching the query.")
 
         return JsonResponse({
-            "liked": liked,
-            "like_count": entry.likes.count(),
+            "liked": result.active,
+            "like_count": result.count,
         })
 
     def handle_no_permission(self):
         """
         Returns a 401 JSON response for unauthenticated AJAX requests.
         """
-        return JsonResponse({"error": "Authentication required."}, status=401)
\ No newline at end of file
+        return JsonResponse({"error": "Authentication required."}, status=401)
+
+
+class LikeToggleAsyncView(AsyncLoginRequiredMixin, View):
+    """
+    Async-native twin of LikeToggleView: same POST params and JSON
+    responses. The toggle itself is one raw-SQL round trip (or a buffer
+    update, see myapp.membership.toggle) and runs in a thread via
+    sync_to_async. Served instead of the sync view when
+    settings.ASYNC_AJAX_VIEWS is on; only useful under ASGI.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        if request.POST.get("action") != "post":
+            return JsonResponse({"error": "Invalid action."}, status=400)
+
+        raw_id = request.POST.get("likeid")
+        if not raw_id or not raw_id.strip().isdigit():
+            return JsonResponse({"error": "Invalid entry ID."}, status=400)
+
+        result = await sync_to_async(toggle)("likes", request.user.id, id=int(raw_id))
+        if result is None:
+            raise Http404("No entry found matching the query.")
+
+        return JsonResponse({
+            "liked": result.active,
+            "like_count": result.count,
+        })
+
+
+# Rows fetched per round trip from the export's server-side cursor
+EXPORT_CHUNK_SIZE = 2000
+# Bytes of encoded rows collected before a chunk is compressed and sent
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+
+def accepts_gzip(accept_encoding):
+    """
+    True if an Accept-Encoding header allows gzip: listed (or covered by
+    '*' when not listed) with a q-value above zero, so 'gzip;q=0' refuses it.
+    """
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = (part.strip() for part in item.split(";"))
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+class EntryExportView(LoginRequiredMixin, View):
+    """
+    Streams all of the current user's entries as a download.
+
+    Rows come from a server-side cursor and are encoded (and gzipped, when
+    the client accepts it) as they are read, so memory use does not grow
+    with the number of entries. The response carries Last-Modified (the
+    newest updated_at) and an ETag that also covers the user and the entry
+    count, so an unchanged journal answers If-Modified-Since /
+    If-None-Match with 304. Like the per-user myapp pages it is marked
+    private and no-cache and varies on Cookie.
+
+    Access: login required — unauthenticated users are redirected to LOGIN_URL.
+
+    Query params:
+        format (str): 'jsonl' (default, NDJSON) | 'csv'
+    """
+
+    content_types = {
+        "jsonl": "application/x-ndjson",
+        "csv": "text/csv; charset=utf-8",
+    }
+
+    def get(self, request, *args, **kwargs):
+        fmt = request.GET.get("format", "jsonl")
+        if fmt not in self.content_types:
+            return JsonResponse({"error": "Unknown format."}, status=400)
+
+        entries = Entry.objects.filter(author=request.user)
+        compress = accepts_gzip(request.headers.get("Accept-Encoding", ""))
+
+        # One aggregate yields both validators
+        state = entries.aggregate(last_modified=Max("updated_at"), count=Count("id"))
+        stamp = state["last_modified"].timestamp() if state["last_modified"] else 0
+        # The count catches deletions, which leave max(updated_at) unchanged
+        etag = f'"{request.user.pk}-{state["count"]}-{stamp}-{fmt}{"-gz" if compress else ""}"'
+        # HTTP dates have whole-second precision
+        last_modified = int(stamp) if state["last_modified"] else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = StreamingHttpResponse(
+                self.stream(entries, fmt, compress), content_type=self.content_types[fmt]
+            )
+            response["Content-Disposition"] = f'attachment; filename="journal.{fmt}"'
+            if compress:
+                response["Content-Encoding"] = "gzip"
+
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        # One URL serves every user's private journal: keep it out of
+        # shared caches and have browsers revalidate
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ["Accept-Encoding", "Cookie"])
+        return response
+
+    def stream(self, entries, fmt, compress):
+        """Yields the encoded rows in EXPORT_FLUSH_BYTES blocks."""
+        # wbits=31 writes a gzip (not raw zlib) header and trailer
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+        def emit(data):
+            return compressor.compress(data) if compressor else data
+
+        buffer = []
+        size = 0
+        if fmt == "csv":
+            encoder = CSVEncoder()
+            buffer.append(encoder.header())
+            encode = encoder.encode
+        else:
+            encode = encode_jsonl
+
+        for row in export_rows(entries, EXPORT_CHUNK_SIZE):
+            line = encode(row)
+            buffer.append(line)
+            size += len(line)
+            if size >= EXPORT_FLUSH_BYTES:
+                chunk = emit(b"".join(buffer))
+                buffer, size = [], 0
+                if chunk:
+                    yield chunk
+
+        tail = emit(b"".join(buffer))
+        if compressor:
+            tail += compressor.flush()
+        if tail:
+            yield tail